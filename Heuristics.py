@@ -1,8 +1,106 @@
 import math
 
 from Constants import GOAL_P2, GOAL_P1
-from Players import RandomPlayer
-from game_faster import Quoridor
+from batch_rollout import simulate_batch
+from rollout import simulate
+
+
+class EvaluationContext:
+    """
+    The quantities of a state that the heuristics share, computed on first use and kept for the
+    following terms, so a combination of terms does a single shortest path search per player.
+    The evaluation functions of this module take either a game state or a context.
+    A context is valid as long as its state doesn't change, build a new one for every evaluated state.
+
+    Parameters
+    ----------
+    game_state : Quoridor
+        The evaluated state.
+    """
+
+    __slots__ = ("game_state", "_self_path_length", "_opponent_path_length",
+                 "_self_path", "_opponent_path", "_repetitions", "_opponent_walls_distance")
+
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self._self_path_length = None
+        self._opponent_path_length = None
+        self._self_path = None
+        self._opponent_path = None
+        self._repetitions = None
+        self._opponent_walls_distance = None
+
+    @property
+    def self_path_length(self) -> int:
+        if self._self_path_length is None:
+            player = self.game_state.current_player
+            self._self_path_length = self.game_state.get_shortest_path_length(player.pos, player.goal)
+        return self._self_path_length
+
+    @property
+    def opponent_path_length(self) -> int:
+        if self._opponent_path_length is None:
+            opponent = self.game_state.waiting_player
+            self._opponent_path_length = self.game_state.get_shortest_path_length(opponent.pos, opponent.goal)
+        return self._opponent_path_length
+
+    @property
+    def self_path(self):
+        if self._self_path is None:
+            player = self.game_state.current_player
+            self._self_path = self.game_state.get_shortest_path(player.pos, player.goal)
+        return self._self_path
+
+    @property
+    def opponent_path(self):
+        if self._opponent_path is None:
+            opponent = self.game_state.waiting_player
+            self._opponent_path = self.game_state.get_shortest_path(opponent.pos, opponent.goal)
+        return self._opponent_path
+
+    @property
+    def repetitions(self) -> int:
+        """
+        The number of times the current player came back to a position it already visited
+        """
+        if self._repetitions is None:
+            player = self.game_state.current_player
+            self._repetitions = len(player.position_history) + 1 - len(set(player.position_history) | {player.pos})
+        return self._repetitions
+
+    @property
+    def opponent_walls_distance(self) -> int:
+        """
+        The sum of the distances of the placed walls from the opponent
+        """
+        if self._opponent_walls_distance is None:
+            opponent_pos = self.game_state.waiting_player.pos
+            self._opponent_walls_distance = sum(
+                max(abs(ord(opponent_pos[0]) - ord(wall[0])), abs(ord(opponent_pos[1]) - ord(wall[1])))
+                for wall in self.game_state.placed_walls
+            )
+        return self._opponent_walls_distance
+
+
+def evaluation_context(game_state) -> EvaluationContext:
+    """
+    Returns the context of the evaluated state, the given context when the heuristic is a term of a combination
+    """
+    return game_state if type(game_state) is EvaluationContext else EvaluationContext(game_state)
+
+
+def context_game_state(game_state):
+    """
+    Returns the evaluated game state of a context, or the given game state
+    """
+    return game_state.game_state if type(game_state) is EvaluationContext else game_state
+
+
+def with_context(evaluation_function):
+    """
+    Wraps a combination of heuristics, so its terms get the same context of the evaluated state
+    """
+    return lambda game_state: evaluation_function(evaluation_context(game_state))
 
 
 def null_evaluation_function(game_state):
@@ -16,14 +114,14 @@ def exp_shortest_self_dist_from_goal_evaluation_function(game_state):
     """
     Exponential distance of current player to its goal, uses the shortest path
     """
-    return math.exp(-len(game_state.get_shortest_path(game_state.current_player.pos,game_state.current_player.goal)))
+    return math.exp(-evaluation_context(game_state).self_path_length)
 
 
 def shortest_self_dist_from_goal_evaluation_function(game_state):
     """
     Distance of current player to its goal, uses the shortest path
     """
-    return -len(game_state.get_shortest_path(game_state.current_player.pos,game_state.current_player.goal))
+    return -evaluation_context(game_state).self_path_length
 
 
 def naive_self_dist_from_goal_evaluation_function(game_state):
@@ -31,28 +129,28 @@ def naive_self_dist_from_goal_evaluation_function(game_state):
     Distance of current player to its goal, uses the naive (straight) distance
 
     """
-    return -naive_player_dist_from_goal(game_state.current_player)
+    return -naive_player_dist_from_goal(context_game_state(game_state).current_player)
 
 
 def exp_shortest_opponent_dist_from_goal_evaluation_function(game_state):
     """
     Exponential distance of opponent player to its goal, uses the shortest path
     """
-    return -math.exp(-len(game_state.get_shortest_path(game_state.waiting_player.pos,game_state.waiting_player.goal)))
+    return -math.exp(-evaluation_context(game_state).opponent_path_length)
 
 
 def shortest_opponent_dist_from_goal_evaluation_function(game_state):
     """
     Distance of opponent player to its goal, uses the shortest path
     """
-    return -len(game_state.get_shortest_path(game_state.waiting_player.pos,game_state.waiting_player.goal))
+    return -evaluation_context(game_state).opponent_path_length
 
 
 def naive_opponent_dist_from_goal_evaluation_function(game_state):
     """
     Distance of opponent player to its goal, uses the naive (straight) distance
     """
-    return -naive_player_dist_from_goal(game_state.waiting_player)
+    return -naive_player_dist_from_goal(context_game_state(game_state).waiting_player)
 
 
 def naive_player_dist_from_goal(player):
@@ -66,67 +164,46 @@ def both_goals_evaluation_function(game_state, opponent_factor=1):
     """
     Heuristic function that combines the player's distance, opponent distance and looping penalty
     """
-    loop_penalty = len(game_state.current_player.position_history + [game_state.current_player.pos]) - \
-                   len(set(game_state.current_player.position_history + [game_state.current_player.pos]))
-    return shortest_self_dist_from_goal_evaluation_function(
-        game_state) + opponent_factor * shortest_opponent_dist_from_goal_evaluation_function(game_state) - loop_penalty*100
+    context = evaluation_context(game_state)
+    return -context.self_path_length - opponent_factor * context.opponent_path_length - context.repetitions*100
 
 
 def prevent_loop_function(game_state):
     """
     penalty for preventing looping
     """
-    loop_penalty = len(game_state.current_player.position_history + [game_state.current_player.pos]) - \
-                   len(set(game_state.current_player.position_history + [game_state.current_player.pos]))
-    return loop_penalty
+    return evaluation_context(game_state).repetitions
 
 
-def statistic_simulation_random_player(game_state, num_to_simulate):
+def statistic_simulation_random_player(game_state, num_to_simulate, backend="rollout", rng=None):
     """
     Heuristic function that runs games between two random players and uses the results to
-    evaluate the state.
-    """
-    wins = [0, 0]
-    for _ in range(num_to_simulate):
-        random_player_1 = RandomPlayer(
-            id=0,
-            pos=game_state.current_player.pos,
-            goal=game_state.current_player.goal,
-        )
-        random_player_2 = RandomPlayer(
-            id=1,
-            pos=game_state.waiting_player.pos,
-            goal=game_state.waiting_player.goal,
-        )
-        quoridor = Quoridor(random_player_1, random_player_2)
-
-        for wall in game_state.placed_walls:
-            quoridor._make_wall_move(quoridor.board, wall)
-        quoridor._switch_player()
-        result = quoridor.play_game(simulate=True)
-        wins[result.winner.id] += 1
-    return 1-(wins[0] / num_to_simulate)
+    evaluate the state. The games start with the waiting player and are played by the backend:
+    "rollout" plays them one by one with the rollout engine, "batch" plays them all at once with NumPy.
+    The batch backend takes an optional np.random.Generator, by default it is seeded from the `random` module.
+    """
+    game_state = context_game_state(game_state)
+    if backend == "batch":
+        winners, _ = simulate_batch(game_state, num_to_simulate, first=1, rng=rng)
+        return float((winners == 0).mean())
+    if backend != "rollout":
+        raise ValueError(f"Unknown simulation backend: {backend}")
+    winners = simulate(game_state, num_to_simulate, first=1)
+    return winners.count(0) / num_to_simulate
 
 
 def walls_dist_heuristic(game_state):
     """
     Heuristic that considers the walls locations
     """
-    opponent = game_state.waiting_player
-    total_dist = 0
-
-    for wall in game_state.placed_walls:
-        total_dist += max(abs(ord(opponent.pos[0]) - ord(wall[0])), abs(ord(opponent.pos[1]) - ord(wall[1])))
-
-    return -total_dist
+    return -evaluation_context(game_state).opponent_walls_distance
 
 
 def blocking_opponent_path_heuristic(game_state):
-    opponent = game_state.waiting_player
-    opponent_path = game_state.get_shortest_path(opponent.pos, opponent.goal)
+    opponent_path = evaluation_context(game_state).opponent_path
     blocking_walls = 0
 
-    for wall in game_state.current_player.placed_walls:
+    for wall in context_game_state(game_state).current_player.placed_walls:
         if any(wall[:2] == step or wall[2:] == step for step in opponent_path):
             blocking_walls += 1
 
@@ -134,4 +211,4 @@ def blocking_opponent_path_heuristic(game_state):
 
 
 def shortest_opponent_path(game_state):
-    return len(game_state.get_shortest_path(game_state.waiting_player.pos, game_state.waiting_player.goal))
+    return evaluation_context(game_state).opponent_path_length
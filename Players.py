@@ -1,11 +1,23 @@
 import math
+import multiprocessing
 import random
+import time
+import weakref
 from dataclasses import field, dataclass
 from typing import List
 
 import numpy as np
 
-from Constants import START_WALLS, GameStatus
+from Constants import POSSIBLE_WALLS, START_WALLS, GameStatus
+from board_index import CELL_INDEX, NEAR_CELL_SLOTS, NEAR_WALL_SLOTS, WALL_SIZE, WALL_TABLE
+from exceptions import SearchTimeoutError
+from transposition_table import Bound, TranspositionTable
+
+# Hash key that separates max nodes from min nodes in the transposition table
+MAX_NODE_KEY = 0x5BD1E9955BD1E995
+# Multipliers of the repetitions of each player at the root, mixed into the transposition table keys
+REPETITION_KEYS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F)
+ZOBRIST_MASK = (1 << 64) - 1
 
 @dataclass
 class Player:
@@ -46,13 +58,12 @@ class Player:
 class RandomPlayer(Player):
     """
     Random player that half of the turns choose a random pawn move and otherwise choose a random legal action
+    (out of the filtered moves, see `sample_filtered_move`)
     """
     def get_action(self, game_state):
         if random.random() < .5:
-            moves = list(game_state.get_legal_pawn_moves())
-        else:
-            moves = filter_moves(game_state)
-        return random.choice(moves)
+            return random.choice(list(game_state.get_legal_pawn_moves()))
+        return sample_filtered_move(game_state)
 
 class HeuristicPlayer(Player):
     """
@@ -97,49 +108,444 @@ class HeuristicPlayer(Player):
 
 class AlphaBetaPlayer(Player):
     """
-    Minimax player that uses alpha beta prunning
+    Minimax player that uses alpha beta prunning.
+    The moves of every node are ordered by the given `MoveOrdering`, or just by the best known move if none is given.
+    Searched positions are kept in a transposition table keyed by the position's Zobrist hash,
+    which is used both to cut off subtrees and to try the best known move first.
+    The hash doesn't cover the positions the pawns visited, which the evaluation functions penalize when they
+    repeat: the repetitions of the root are mixed into the keys, and the values of subtrees with a leaf that has
+    more repetitions than the root (a repetition made during the search) are not stored.
+
+    When a time budget is given (per move and/or per game), the search deepens iteratively up to
+    `max_depth` and returns the result of the deepest iteration that finished before the deadline.
+    The depth reached on every move is kept in `reached_depths`.
+
+    `search_algorithm` selects the search core:
+    * "minimax": the original search, which bounds every node by its parent's value only.
+    * "negamax": negamax with a full (alpha, beta) window and principal variation search. It finds
+      the same value (and the same move, up to ties) while searching fewer nodes.
+      With iterative deepening, `aspiration_window` narrows the root window around the previous
+      iteration's value.
+
+    With `workers` > 1 the root moves are split over a pool of worker processes, each searching
+    one root move at a time on a copy of the game rebuilt from its compact state. The best value
+    found so far is shared between the workers as the bound of the following root moves.
+    The pool is forked from the current process (so evaluation functions don't have to be picklable)
+    and is kept until `close` is called, the player is a context manager that closes it on exit.
+    A pool that wasn't closed is stopped when the interpreter exits.
     """
-    def __init__(self, id, pos, goal, evaluation_function,walls=START_WALLS, position_history=None, placed_walls=None, depth=1):
+    def __init__(self, id, pos, goal, evaluation_function,walls=START_WALLS, position_history=None, placed_walls=None, depth=1,
+                 transposition_table_size=2 ** 16, replacement="depth",
+                 move_time_budget=None, game_time_budget=None, max_depth=None, move_ordering=None,
+                 search_algorithm="minimax", aspiration_window=None, workers=1):
         super().__init__(id, pos, goal, walls, position_history, placed_walls)
         self.depth = depth
         self.position_history = []
         self.placed_walls = []
         self.evaluation_function = evaluation_function
+        self.transposition_table = TranspositionTable(transposition_table_size, replacement) \
+            if transposition_table_size else None
+        self.searched_nodes = []
+        self.nodes = 0
+        self.move_time_budget = move_time_budget
+        self.game_time_budget = game_time_budget
+        self.max_depth = max_depth
+        self.game_time_used = 0
+        self.reached_depths = []
+        self.deadline = None
+        self.move_ordering = move_ordering
+        if search_algorithm not in ("minimax", "negamax"):
+            raise ValueError(f"Unknown search algorithm: {search_algorithm}")
+        self.search_algorithm = search_algorithm
+        self.aspiration_window = aspiration_window
+        self.workers = workers
+        self._pool = None
+        self._pool_finalizer = None
+        self._shared_alpha = None
+        # the root position the worker process searched last, a new one starts a new search
+        self._worker_root = None
+        # number of evaluated leaves with more repetitions than the root, a node whose subtree added to it isn't stored
+        self.repetition_leaves = 0
+        # repetitions of (player1, player2) at the root of the search, and their part of the table keys
+        self._root_repetitions = (0, 0)
+        self._repetition_key = 0
 
     def get_action(self, game_state):
-        value, action = self.__recursive_minimax(game_state, self.depth, True, np.inf)
+        self.nodes = 0
+        self.__set_search_root(game_state)
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        if self.move_ordering is not None:
+            self.move_ordering.new_search()
+        if self.move_time_budget is None and self.game_time_budget is None:
+            value, action = self.__search(game_state, self.depth)
+            self.reached_depths.append(self.depth)
+        else:
+            action = self.__iterative_deepening(game_state)
+        self.searched_nodes.append(self.nodes)
+        return action
+
+    def __set_search_root(self, game_state):
+        """
+        Keeps the repetitions of the root, the keys of positions searched after different repetitions differ
+        """
+        self._root_repetitions = (repetitions(game_state.player1), repetitions(game_state.player2))
+        self._repetition_key = (self._root_repetitions[0] * REPETITION_KEYS[0]
+                                ^ self._root_repetitions[1] * REPETITION_KEYS[1]) & ZOBRIST_MASK
+
+    def __iterative_deepening(self, game_state):
+        """
+        Searches with increasing depths until the time budget of the move runs out,
+        returns the best move of the deepest completed search
+        """
+        start = time.perf_counter()
+        if len(game_state.moves) <= 1:  # a new game started
+            self.game_time_used = 0
+        self.deadline = start + self.__move_time_budget(game_state)
+        root_moves = len(game_state.moves)
+        action = None
+        value = None
+        reached_depth = 0
+        depth = 1
+        try:
+            while self.max_depth is None or depth <= self.max_depth:
+                value, action = self.__search(game_state, depth, action, value)
+                reached_depth = depth
+                if abs(value) == np.inf:  # the game is decided, searching deeper won't change the move
+                    break
+                depth += 1
+        except SearchTimeoutError:
+            while len(game_state.moves) > root_moves:
+                game_state.undo_move()
+        finally:
+            self.deadline = None
+            self.game_time_used += time.perf_counter() - start
+
+        if action is None:
+            # not even the first iteration finished, fall back to the best move seen so far
+            entry = self.transposition_table.probe(game_state.zobrist_hash ^ self._repetition_key ^ MAX_NODE_KEY) \
+                if self.transposition_table is not None else None
+            action = entry.move if entry is not None else filter_moves(game_state)[0]
+        self.reached_depths.append(reached_depth)
         return action
 
-    def __recursive_minimax(self, game_state, depth, is_max, best_other):
+    def __move_time_budget(self, game_state):
+        """
+        The time this move may take, the game budget is split evenly over the moves
+        the player still needs to reach its goal
+        """
+        budgets = []
+        if self.move_time_budget is not None:
+            budgets.append(self.move_time_budget)
+        if self.game_time_budget is not None:
+            moves_left = max(game_state.get_shortest_path_length(self.pos, self.goal) - 1, 1)
+            budgets.append(max(self.game_time_budget - self.game_time_used, 0) / moves_left)
+        return min(budgets)
+
+    def __search(self, game_state, depth, first_move=None, previous_value=None):
+        """
+        Searches the root with the selected search algorithm, returns the value and the best move
+        """
+        if self.workers > 1:
+            return self.__parallel_search(game_state, depth, first_move)
+        if self.search_algorithm == "minimax":
+            return self.__recursive_minimax(game_state, depth, True, np.inf, first_move)
+        if self.aspiration_window is not None and previous_value is not None and abs(previous_value) != np.inf:
+            alpha = previous_value - self.aspiration_window
+            beta = previous_value + self.aspiration_window
+            value, action = self.__negamax(game_state, depth, alpha, beta, True, first_move)
+            if alpha < value < beta:
+                return value, action
+            # the value is outside the window, search again with the full window
+            first_move = action
+        return self.__negamax(game_state, depth, -np.inf, np.inf, True, first_move)
+
+    def __parallel_search(self, game_state, depth, first_move=None):
+        """
+        Splits the root moves over the worker pool, returns the value and the best move.
+        The best move is the first of the ordered root moves with the best value, like in the serial search
+        """
+        key = game_state.zobrist_hash ^ self._repetition_key ^ MAX_NODE_KEY
+        entry = self.transposition_table.probe(key) if self.transposition_table is not None else None
+        moves = filter_moves(game_state)
+        if self.move_ordering is not None:
+            moves = self.move_ordering.order(game_state, moves, 0, (entry and entry.move, first_move))
+        else:
+            for ordered_move in (first_move, entry and entry.move):
+                if ordered_move in moves:
+                    moves.remove(ordered_move)
+                    moves.insert(0, ordered_move)
+
+        pool = self.__worker_pool()
+        # young brothers wait: the first move is searched here with the full window,
+        # so the workers start with its value as the bound of the other moves
+        repetition_leaves = self.repetition_leaves
+        value, action = self.__search_root_move(game_state, moves[0], depth, -np.inf), moves[0]
+        self._shared_alpha.value = value
+        compact_state = game_state.get_compact_state()
+        tasks = [(compact_state, move, depth, self.deadline) for move in moves[1:]]
+        for move, move_value, nodes, move_repetition_leaves in pool.imap(_search_root_move, tasks):
+            self.nodes += nodes
+            self.repetition_leaves += move_repetition_leaves
+            if move_value is None:
+                raise SearchTimeoutError()
+            if move_value > value:
+                value, action = move_value, move
+
+        if self.transposition_table is not None and self.repetition_leaves == repetition_leaves:
+            self.transposition_table.store(key, depth, value, Bound.EXACT, action)
+        return value, action
+
+    def __worker_pool(self):
+        if self._pool is None:
+            context = multiprocessing.get_context("fork")
+            self._shared_alpha = context.Value("d", -np.inf)
+            self._pool = context.Pool(self.workers, initializer=_init_root_split_worker, initargs=(self,))
+            self._pool_finalizer = weakref.finalize(self, _stop_pool, self._pool)
+        return self._pool
+
+    def close(self):
+        """
+        Stops the worker processes of the parallel search
+        """
+        if self._pool is not None:
+            self._pool_finalizer()
+            self._pool = None
+            self._pool_finalizer = None
+            self._shared_alpha = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _search_root_move(self, compact_state, move, depth, deadline):
+        """
+        Searches a single root move in a worker process, returns the move, its value (None if the
+        deadline passed), the number of searched nodes and the number of evaluated leaves with repetitions
+        """
+        game_state = compact_state[0].from_compact_state(compact_state)
+        if compact_state != self._worker_root:
+            # the tasks of a root position come in a row, a new root is a new search like in get_action
+            self._worker_root = compact_state
+            if self.transposition_table is not None:
+                self.transposition_table.new_search()
+            if self.move_ordering is not None:
+                self.move_ordering.new_search()
+        self.nodes = 0
+        self.__set_search_root(game_state)
+        self.repetition_leaves = 0
+        self.deadline = deadline
+        try:
+            value = self.__search_root_move(game_state, move, depth, self._shared_alpha.value)
+        except SearchTimeoutError:
+            return move, None, self.nodes, self.repetition_leaves
+        with self._shared_alpha.get_lock():
+            if value > self._shared_alpha.value:
+                self._shared_alpha.value = value
+        return move, value, self.nodes, self.repetition_leaves
+
+    def __search_root_move(self, game_state, move, depth, alpha):
+        """
+        The value of a root move, exact unless it is worse than alpha
+        """
+        # moves tied with the best one must get exact values, so the bound is kept just below it
+        if alpha != -np.inf:
+            alpha = math.nextafter(alpha, -np.inf)
+        game_state.make_move(move)
+        try:
+            if self.search_algorithm == "minimax":
+                return self.__recursive_minimax(game_state, depth, False, alpha, ply=1)[0]
+            if alpha != -np.inf:
+                # null window search like the serial search, re-searched only when the move isn't worse
+                null_beta = math.nextafter(alpha, np.inf)
+                value = -self.__negamax(game_state, depth, -null_beta, -alpha, False, ply=1)[0]
+                if value <= alpha:
+                    return value
+            return -self.__negamax(game_state, depth, -np.inf, -alpha, False, ply=1)[0]
+        finally:
+            game_state.undo_move()
+
+    def __repeated_during_search(self, game_state):
+        """
+        Whether the player to move has more repetitions than at the root
+        """
+        player = game_state.current_player
+        return repetitions(player) > self._root_repetitions[player is game_state.player2]
+
+    def __negamax(self, game_state, depth, alpha, beta, is_max, first_move=None, ply=0):
+        """
+        Negamax alpha beta search with principal variation search.
+        The value is from the point of view of the player to move, the evaluation function
+        is only called on max nodes (depth is lowered after the opponent's moves).
+        """
+        self.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeoutError()
+        if game_state.status == GameStatus.COMPLETED:
+            # the player that just moved won
+            return -np.inf, ""
+        if depth <= 0:
+            self.repetition_leaves += self.__repeated_during_search(game_state)
+            value = self.evaluation_function(game_state)
+            return (value if is_max else -value), ""
+
+        original_alpha = alpha
+        repetition_leaves = self.repetition_leaves
+        key = game_state.zobrist_hash ^ self._repetition_key ^ (MAX_NODE_KEY if is_max else 0)
+        table_move = None
+        if self.transposition_table is not None:
+            entry = self.transposition_table.probe(key)
+            if entry is not None:
+                table_move = entry.move
+                if entry.depth >= depth:
+                    if entry.bound == Bound.EXACT:
+                        return entry.score, entry.move
+                    if entry.bound == Bound.LOWER:
+                        alpha = max(alpha, entry.score)
+                    elif entry.bound == Bound.UPPER:
+                        beta = min(beta, entry.score)
+                    if alpha >= beta:
+                        return entry.score, entry.move
+
+        filtered = filter_moves(game_state)
+        if self.move_ordering is not None:
+            filtered = self.move_ordering.order(game_state, filtered, ply, (table_move, first_move))
+        else:
+            for ordered_move in (first_move, table_move):
+                if ordered_move in filtered:
+                    filtered.remove(ordered_move)
+                    filtered.insert(0, ordered_move)
+        value = -np.inf
+        action = filtered[0]
+
+        for index, next_action in enumerate(filtered):
+            game_state.make_move(next_action)
+            next_depth = depth if is_max else depth - (1 if len(next_action) == 2 else 3)
+            if index == 0:
+                next_value = -self.__negamax(game_state, next_depth, -beta, -alpha, not is_max, ply=ply + 1)[0]
+            else:
+                # null window search, only proves the move isn't better than the best one so far
+                null_beta = math.nextafter(alpha, np.inf)
+                next_value = -self.__negamax(game_state, next_depth, -null_beta, -alpha, not is_max, ply=ply + 1)[0]
+                if alpha < next_value < beta:
+                    next_value = -self.__negamax(game_state, next_depth, -beta, -next_value, not is_max,
+                                                 ply=ply + 1)[0]
+            game_state.undo_move()
+            if next_value > value:
+                value = next_value
+                action = next_action
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                if self.move_ordering is not None:
+                    self.move_ordering.record_cutoff(action, ply, depth)
+                break
+
+        if self.transposition_table is not None and self.repetition_leaves == repetition_leaves:
+            if value <= original_alpha:
+                bound = Bound.UPPER
+            elif value >= beta:
+                bound = Bound.LOWER
+            else:
+                bound = Bound.EXACT
+            self.transposition_table.store(key, depth, value, bound, action)
+        return value, action
+
+    def __recursive_minimax(self, game_state, depth, is_max, best_other, first_move=None, ply=0):
+        self.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeoutError()
         if game_state.status == GameStatus.COMPLETED:
             if depth == 2:
                 print('a')
             return (np.inf, "") if not is_max else (-np.inf, "")
         if depth <= 0:
-            return self.evaluation_function(game_state), game_state.get_legal_moves()[0]
+            self.repetition_leaves += self.__repeated_during_search(game_state)
+            return self.evaluation_function(game_state), ""
+
+        repetition_leaves = self.repetition_leaves
+        # the same position is a max node or a min node depending on the seat this player has in the game
+        key = game_state.zobrist_hash ^ self._repetition_key ^ (MAX_NODE_KEY if is_max else 0)
+        table_move = None
+        if self.transposition_table is not None:
+            entry = self.transposition_table.probe(key)
+            if entry is not None:
+                table_move = entry.move
+                if entry.depth >= depth:
+                    if entry.bound == Bound.EXACT:
+                        return entry.score, entry.move
+                    if entry.bound == Bound.LOWER and is_max and best_other < entry.score:
+                        return entry.score, entry.move
+                    if entry.bound == Bound.UPPER and not is_max and best_other > entry.score:
+                        return entry.score, entry.move
+
         value = -np.inf if is_max else np.inf
         filtered = filter_moves(game_state)
+        if self.move_ordering is not None:
+            filtered = self.move_ordering.order(game_state, filtered, ply, (table_move, first_move))
+        else:
+            for ordered_move in (first_move, table_move):
+                if ordered_move in filtered:
+                    filtered.remove(ordered_move)
+                    filtered.insert(0, ordered_move)
         action = filtered[0]
+        bound = Bound.EXACT
 
         for next_action in filtered:
             game_state.make_move(next_action)
             depth_sub = 1 if len(next_action) == 2 else 3
-            next_value, _ = self.__recursive_minimax(game_state, depth - depth_sub if not is_max else depth, not is_max, value)
+            next_value, _ = self.__recursive_minimax(game_state, depth - depth_sub if not is_max else depth, not is_max, value,
+                                                     ply=ply + 1)
             game_state.undo_move()
             if is_max:
                 if smaller_or_equals_with_chance(value, next_value):
                     value = next_value
                     action = next_action
                 if best_other < value:
+                    bound = Bound.LOWER
                     break
             else:
                 if not smaller_or_equals_with_chance(value, next_value):
                     value = next_value
                     action = next_action
                 if best_other > value:
+                    bound = Bound.UPPER
                     break
+
+        if bound != Bound.EXACT and self.move_ordering is not None:
+            self.move_ordering.record_cutoff(action, ply, depth)
+        if self.transposition_table is not None and self.repetition_leaves == repetition_leaves:
+            self.transposition_table.store(key, depth, value, bound, action)
         return value, action
 
+# The player searching in the worker processes of a parallel search, set when the pool is forked
+_root_split_player = None
+
+
+def _init_root_split_worker(player):
+    global _root_split_player
+    _root_split_player = player
+
+
+def _search_root_move(task):
+    return _root_split_player._search_root_move(*task)
+
+
+def _stop_pool(pool):
+    pool.terminate()
+    pool.join()
+
+
+def repetitions(player):
+    """
+    The number of times the player came back to a position it already visited, which the evaluation functions
+    penalize (see `EvaluationContext.repetitions`) and the Zobrist hash doesn't cover
+    """
+    history = player.position_history
+    return len(history) + 1 - len(set(history) | {player.pos})
+
+
 def dist_from_cell(move, pos):
     """
     Measures the distance between a given move and a given pos
@@ -151,21 +557,61 @@ def filter_moves(game_state):
     """
     Filter the legal moves based on our assumption about the game: walls should be placed near other walls/players
     Used in order to reduce the branching factor and speed up the agents
+    Only the walls near the players/placed walls are checked (see filter_wall_candidates), against the cached
+    legal walls of the position or by validating them. The pawn moves come first and the walls follow in the
+    order of POSSIBLE_WALLS
     """
-    filtered_moves = []
-    for move in game_state.get_legal_moves():
-        if len(move) == 2:
-            filtered_moves.append(move)
-        elif dist_from_cell(move, game_state.current_player.pos) <= 1:
-            filtered_moves.append(move)
-        elif dist_from_cell(move, game_state.waiting_player.pos) <= 1:
-            filtered_moves.append(move)
-        else:
-            for wall in game_state.placed_walls:
-                if dist_from_cell(move, wall[:2]) <= 1:
-                    filtered_moves.append(move)
-                    break
-    return filtered_moves
+    return list(game_state.get_legal_pawn_moves()) + game_state.filter_legal_walls(filter_wall_candidates(game_state))
+
+
+def filter_wall_candidates(game_state):
+    """
+    Returns the walls that pass the distance rule of filter_moves (near the players or the placed walls),
+    in the order of POSSIBLE_WALLS, without checking if they are legal
+    """
+    if game_state.current_player.walls == 0:
+        return []
+    mask = NEAR_CELL_SLOTS[CELL_INDEX[game_state.current_player.pos]] | \
+        NEAR_CELL_SLOTS[CELL_INDEX[game_state.waiting_player.pos]]
+    for wall in game_state.placed_walls:
+        mask |= NEAR_WALL_SLOTS[WALL_TABLE[wall][1].bit_length() - 1]
+    # the slots are numbered by row and POSSIBLE_WALLS by column (then h before v)
+    columns = []
+    while mask:
+        low_bit = mask & -mask
+        row, column = divmod(low_bit.bit_length() - 1, WALL_SIZE)
+        columns.append(column * WALL_SIZE + row)
+        mask ^= low_bit
+    columns.sort()
+    candidates = []
+    for index in columns:
+        candidates.append(POSSIBLE_WALLS[2 * index])
+        candidates.append(POSSIBLE_WALLS[2 * index + 1])
+    return candidates
+
+
+def sample_filtered_move(game_state, max_rejections=8):
+    """
+    Picks a random move out of filter_moves without generating all of them.
+    A candidate (pawn move or a wall near the players/placed walls) is drawn and only it is validated,
+    an illegal wall is dropped and another candidate is drawn. Drawing from the candidates until a legal
+    one comes up picks uniformly from the legal ones, so the move has the same distribution as
+    random.choice(filter_moves(game_state)): every pawn move and every filtered legal wall with the
+    same probability. After max_rejections illegal walls (most of the candidates are blocked, e.g. when
+    the board is nearly full) it falls back to the full generation.
+    """
+    pawn_moves = list(game_state.get_legal_pawn_moves())
+    walls = filter_wall_candidates(game_state)
+    for _ in range(max_rejections + 1):
+        index = random.randrange(len(pawn_moves) + len(walls))
+        if index < len(pawn_moves):
+            return pawn_moves[index]
+        wall = walls[index - len(pawn_moves)]
+        if not game_state.filter_legal_walls([wall]):
+            walls.remove(wall)
+            continue
+        return wall
+    return random.choice(filter_moves(game_state))
 
 
 def smaller_or_equals_with_chance(value1, value2):
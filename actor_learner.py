@@ -0,0 +1,138 @@
+"""
+Multi-process Q learning.
+
+Actor processes play training games with a copy of the learner's policy and
+send back the transitions they saw. The learner applies the transitions to its
+Q table and publishes the changed Q values to the actors every `sync_interval`
+games, so the actors' copies stay a snapshot of the learned table.
+Game play (move generation) is most of the training time and it runs in the actors,
+so the throughput grows with the number of actors (up to the number of cores).
+"""
+import multiprocessing
+import random
+import time
+from typing import Optional
+
+import numpy as np
+import tqdm
+
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2, START_WALLS
+from Players import RandomPlayer
+from game_faster import Quoridor
+from q_table_store import ACTION_CODES, ACTIONS
+from qlearning import QLearningPlayer
+from tournament import PlayerFactory
+
+
+class ActorLearnerTrainer:
+    """
+    Trains a q learner with several actor processes.
+
+    The actors are forked, so the opponent factory doesn't have to be picklable.
+
+    Parameters
+    ----------
+    learner : QLearningPlayer
+        The player to train, its q values are updated in the current process.
+    actors : int, optional
+        The number of actor processes, by default the number of CPUs.
+    sync_interval : int, optional
+        The number of games every actor plays between two snapshots of the q values, by default 5.
+    opponent_factory : callable, optional
+        Builds the actors' opponent from its (id, pos, goal), by default a random player.
+    engine : type, optional
+        The game engine, by default `Quoridor`.
+    seed : int, optional
+        The seed of the first actor, the following actors get the following seeds, by default 0.
+    """
+
+    def __init__(self, learner: QLearningPlayer, actors: Optional[int] = None, sync_interval: int = 5,
+                 opponent_factory: Optional[PlayerFactory] = None, engine: type = Quoridor, seed: int = 0):
+        self.learner = learner
+        self.actors = actors or multiprocessing.cpu_count()
+        self.sync_interval = sync_interval
+        self.opponent_factory = opponent_factory or (lambda id, pos, goal: RandomPlayer(id, pos, goal))
+        self.engine = engine
+        self.seed = seed
+        self.games_per_second = 0.0
+
+    def train(self, number_of_games: int, progress: bool = True) -> QLearningPlayer:
+        """
+        Plays the training games in the actors and learns their transitions.
+
+        Parameters
+        ----------
+        number_of_games : int
+            The number of training games, rounded up to whole sync intervals of all the actors.
+        progress : bool, optional
+            Whether to show a progress bar, by default True.
+
+        Returns
+        -------
+        QLearningPlayer
+            The trained learner.
+        """
+        rounds = -(-number_of_games // (self.actors * self.sync_interval))
+        context = multiprocessing.get_context("fork")
+        snapshot_queues = [context.Queue() for _ in range(self.actors)]
+        transition_queue = context.Queue()
+        processes = [
+            context.Process(target=self._act, args=(actor, snapshot_queues[actor], transition_queue), daemon=True)
+            for actor in range(self.actors)
+        ]
+        for process in processes:
+            process.start()
+
+        start = time.perf_counter()
+        # the actors were forked with the current table, then they get the values that changed
+        snapshot = {}
+        try:
+            with tqdm.tqdm(total=rounds * self.actors * self.sync_interval, disable=not progress) as progress_bar:
+                for _ in range(rounds):
+                    for queue in snapshot_queues:
+                        queue.put(snapshot)
+                    changed = set()
+                    for _ in range(self.actors):
+                        for state_key, action, reward, next_state_key, next_actions in transition_queue.get():
+                            self.learner.learn(state_key, action, reward, next_state_key,
+                                               [ACTIONS[code] for code in next_actions])
+                            changed.add((state_key, action))
+                        progress_bar.update(self.sync_interval)
+                    snapshot = {state_action: self.learner.q_values[state_action] for state_action in changed}
+        except BaseException:
+            for process in processes:
+                process.terminate()
+            raise
+        for queue in snapshot_queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
+        self.games_per_second = rounds * self.actors * self.sync_interval / (time.perf_counter() - start)
+        return self.learner
+
+    def _act(self, actor: int, snapshot_queue, transition_queue) -> None:
+        """
+        The loop of an actor process: applies a snapshot, plays `sync_interval` games and sends their transitions
+        """
+        random.seed(self.seed + actor)
+        np.random.seed(self.seed + actor)
+        player = self.learner
+        player.transitions = []
+        while True:
+            snapshot = snapshot_queue.get()
+            if snapshot is None:
+                return
+            player.q_values.update(snapshot)
+            for _ in range(self.sync_interval):
+                player.pos = START_POS_P1
+                player.goal = GOAL_P1
+                player.walls = START_WALLS
+                player.position_history = []
+                player.placed_walls = []
+                opponent = self.opponent_factory(2, START_POS_P2, GOAL_P2)
+                self.engine(player, opponent).play_game(simulate=True)
+            transition_queue.put([
+                (state_key, str(action), reward, next_state_key, bytes(ACTION_CODES[action] for action in next_actions))
+                for state_key, action, reward, next_state_key, next_actions in player.transitions
+            ])
+            player.transitions = []
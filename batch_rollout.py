@@ -0,0 +1,310 @@
+"""
+Batched random self-play with NumPy.
+
+`BatchRollout` advances many independent random games from the same position
+in lockstep. The pawn positions, walls, open edges and the distance fields of
+the goal rows of all the games are kept in arrays, so every ply of all the
+games is a handful of vectorized operations.
+
+The games follow the policy of `RandomPlayer`: half of the turns a random pawn
+move, otherwise a uniform pick out of the pawn moves and the legal walls near
+the pawns or the placed walls (the moves of `Players.filter_moves`). A drawn
+wall that would cut a player off is rejected and the pick is drawn again out of
+the rest, which keeps the pick uniform over the legal moves.
+"""
+import random
+from typing import Optional, Tuple
+
+import numpy as np
+
+from board_index import (
+    BOARD_SIZE,
+    CELL_INDEX,
+    DIRECTION_STEPS,
+    GOAL_MASKS,
+    NEAR_CELL_SLOTS,
+    NEAR_WALL_SLOTS,
+    OPEN_DOWN,
+    OPEN_LEFT,
+    OPEN_RIGHT,
+    OPEN_UP,
+    SLOT_WALLS,
+    WALL_TABLE,
+)
+
+CELLS = BOARD_SIZE * BOARD_SIZE
+SLOTS = len(SLOT_WALLS)
+# more than any distance on the board, marks cells that can't reach the goal row
+UNREACHABLE = CELLS
+
+
+def _mask_to_array(mask: int, size: int) -> np.ndarray:
+    return np.array([mask >> index & 1 for index in range(size)], dtype=bool)
+
+
+# wall index is slot * 2 + (0 for horizontal, 1 for vertical)
+WALL_NAMES = [wall for walls in SLOT_WALLS for wall in walls]
+# open edges of the empty board, [up, down, right, left] x cell
+EMPTY_OPEN = np.array([_mask_to_array(mask, CELLS) for mask in (OPEN_UP, OPEN_DOWN, OPEN_RIGHT, OPEN_LEFT)])
+# wall -> [up, down, right, left] x cell edges the wall cuts
+WALL_CUTS = np.array([[_mask_to_array(mask, CELLS) for mask in WALL_TABLE[wall][2]] for wall in WALL_NAMES])
+# wall -> the two pairs of cells the wall separates
+WALL_EDGES = np.array([
+    [[cell, cell + BOARD_SIZE] for cell in range(CELLS) if WALL_TABLE[wall][2][0] >> cell & 1] or
+    [[cell, cell + 1] for cell in range(CELLS) if WALL_TABLE[wall][2][2] >> cell & 1]
+    for wall in WALL_NAMES
+])
+# wall -> the horizontal / vertical slots it conflicts with
+H_CONFLICTS = np.array([_mask_to_array(WALL_TABLE[wall][3][0], SLOTS) for wall in WALL_NAMES], dtype=np.int32)
+V_CONFLICTS = np.array([_mask_to_array(WALL_TABLE[wall][3][1], SLOTS) for wall in WALL_NAMES], dtype=np.int32)
+NEAR_CELL = np.array([_mask_to_array(mask, SLOTS) for mask in NEAR_CELL_SLOTS])
+NEAR_WALL = np.array([_mask_to_array(mask, SLOTS) for mask in NEAR_WALL_SLOTS])
+UP, DOWN, RIGHT, LEFT = range(4)
+STEPS = np.array(DIRECTION_STEPS)
+PERPENDICULAR = ((RIGHT, LEFT), (RIGHT, LEFT), (UP, DOWN), (UP, DOWN))
+# pawn move candidates of a node: per direction the step / jump and the two side steps
+PAWN_CANDIDATES = 12
+
+
+def distance_fields(open_edges: np.ndarray, goals: np.ndarray) -> np.ndarray:
+    """
+    Multi-source breadth first search from the goal rows, for many boards at once.
+
+    Parameters
+    ----------
+    open_edges : np.ndarray
+        Boolean array of shape (games, 4, 81), the open edges of every board.
+    goals : np.ndarray
+        Boolean array of shape (games, 81), the goal row of every search.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (games, 81) with the distance of every cell from the goal row,
+        `UNREACHABLE` for cells that can't reach it.
+    """
+    distances = np.where(goals, 0, UNREACHABLE)
+    reached = goals.copy()
+    frontier = goals.copy()
+    distance = 0
+    while frontier.any():
+        distance += 1
+        expanded = np.zeros_like(frontier)
+        expanded[:, BOARD_SIZE:] |= (frontier & open_edges[:, UP])[:, :-BOARD_SIZE]
+        expanded[:, :-BOARD_SIZE] |= (frontier & open_edges[:, DOWN])[:, BOARD_SIZE:]
+        expanded[:, 1:] |= (frontier & open_edges[:, RIGHT])[:, :-1]
+        expanded[:, :-1] |= (frontier & open_edges[:, LEFT])[:, 1:]
+        frontier = expanded & ~reached
+        reached |= frontier
+        distances[frontier] = distance
+    return distances
+
+
+def _pick(valid: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Picks uniformly one of the valid entries of every row.
+    """
+    counts = valid.sum(axis=1)
+    chosen = (rng.random(len(valid)) * counts).astype(np.int64)
+    return np.argmax(valid.cumsum(axis=1) > chosen[:, None], axis=1)
+
+
+class BatchRollout:
+    """
+    Plays many random games from the same position in lockstep.
+    Seat 0 is the player to move in the given game and seat 1 is the waiting player.
+
+    Parameters
+    ----------
+    game_state : Quoridor
+        The position to play from, any engine.
+    """
+
+    def __init__(self, game_state):
+        players = (game_state.current_player, game_state.waiting_player)
+        self.cells = np.array([CELL_INDEX[player.pos] for player in players])
+        self.goals = np.array([_mask_to_array(GOAL_MASKS[player.goal], CELLS) for player in players])
+        self.walls_left = np.array([player.walls for player in players])
+        self.walls = np.zeros(2 * SLOTS, dtype=bool)
+        self.open_edges = EMPTY_OPEN.copy()
+        self.near_walls = np.zeros(SLOTS, dtype=bool)
+        for wall in game_state.placed_walls:
+            index = WALL_NAMES.index(wall)
+            self.walls[index] = True
+            self.open_edges &= ~WALL_CUTS[index]
+            self.near_walls |= NEAR_WALL[index // 2]
+        self.distances = distance_fields(np.repeat(self.open_edges[None], 2, axis=0), self.goals)
+
+    def play(self, num_games: int, first: int = 0,
+             rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Plays random games from the position.
+
+        Parameters
+        ----------
+        num_games : int
+            The number of games to play.
+        first : int, optional
+            The seat that moves first, by default 0.
+        rng : np.random.Generator, optional
+            The random generator, by default one seeded from the `random` module,
+            so `random.seed` makes the games reproducible like those of `rollout.simulate`.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            The seat of the winner and the number of moves of every game.
+        """
+        rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        winners = np.zeros(num_games, dtype=np.int64)
+        lengths = np.zeros(num_games, dtype=np.int64)
+
+        # state of the running games, rows are dropped as the games end
+        game_ids = np.arange(num_games)
+        cells = np.repeat(self.cells[None], num_games, axis=0)
+        walls_left = np.repeat(self.walls_left[None], num_games, axis=0)
+        walls = np.repeat(self.walls[None], num_games, axis=0)
+        open_edges = np.repeat(self.open_edges[None], num_games, axis=0)
+        near_walls = np.repeat(self.near_walls[None], num_games, axis=0)
+        distances = np.repeat(self.distances[None], num_games, axis=0)
+        side = np.full(num_games, first)
+        moves = 0
+
+        while len(game_ids):
+            rows = np.arange(len(game_ids))
+            current, waiting = cells[rows, side], cells[rows, 1 - side]
+            pawn_targets, pawn_valid = self._pawn_moves(open_edges, current, waiting)
+            wall_turn = (rng.random(len(rows)) >= .5) & (walls_left[rows, side] > 0)
+            choice = np.full(len(rows), -1)
+            pawn_turn = ~wall_turn
+            choice[pawn_turn] = _pick(pawn_valid[pawn_turn], rng)
+
+            if wall_turn.any():
+                choice[wall_turn] = self._pick_filtered_move(
+                    rows[wall_turn], pawn_valid, cells, walls, open_edges, near_walls, distances, current, waiting, rng
+                )
+
+            moves += 1
+            placing = choice >= PAWN_CANDIDATES
+            placing_rows = rows[placing]
+            if len(placing_rows):
+                placed = choice[placing] - PAWN_CANDIDATES
+                walls[placing_rows, placed] = True
+                open_edges[placing_rows] &= ~WALL_CUTS[placed]
+                near_walls[placing_rows] |= NEAR_WALL[placed // 2]
+                walls_left[placing_rows, side[placing_rows]] -= 1
+                distances[placing_rows] = distance_fields(
+                    np.repeat(open_edges[placing_rows], 2, axis=0), np.tile(self.goals, (len(placing_rows), 1))
+                ).reshape(len(placing_rows), 2, CELLS)
+
+            stepping_rows = rows[~placing]
+            targets = pawn_targets[stepping_rows, choice[~placing]]
+            cells[stepping_rows, side[stepping_rows]] = targets
+            won = np.zeros(len(rows), dtype=bool)
+            won[stepping_rows] = self.goals[side[stepping_rows], targets]
+            if won.any():
+                winners[game_ids[won]] = side[won]
+                lengths[game_ids[won]] = moves
+                keep = ~won
+                game_ids, cells, walls_left, walls = game_ids[keep], cells[keep], walls_left[keep], walls[keep]
+                open_edges, near_walls, distances = open_edges[keep], near_walls[keep], distances[keep]
+                side = side[keep]
+            side = 1 - side
+
+        return winners, lengths
+
+    @staticmethod
+    def _pawn_moves(open_edges: np.ndarray, current: np.ndarray, waiting: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the candidate pawn targets of every game and which of them are legal,
+        per direction: the step (or the jump over the opponent) and the two side steps around the opponent.
+        """
+        rows = np.arange(len(current))
+        targets = np.zeros((len(current), PAWN_CANDIDATES), dtype=np.int64)
+        valid = np.zeros((len(current), PAWN_CANDIDATES), dtype=bool)
+        for direction in range(4):
+            column = direction * 3
+            step_open = open_edges[rows, direction, current]
+            target = current + STEPS[direction]
+            facing = step_open & (target == waiting)
+            jump_open = open_edges[rows, direction, waiting]
+            targets[:, column] = np.where(facing, waiting + STEPS[direction], target)
+            valid[:, column] = step_open & (~facing | jump_open)
+            for offset, side_direction in enumerate(PERPENDICULAR[direction], start=1):
+                targets[:, column + offset] = waiting + STEPS[side_direction]
+                valid[:, column + offset] = facing & ~jump_open & open_edges[rows, side_direction, waiting]
+        return targets, valid
+
+    def _pick_filtered_move(self, rows, pawn_valid, cells, walls, open_edges, near_walls, distances,
+                            current, waiting, rng) -> np.ndarray:
+        """
+        Picks uniformly out of the pawn moves and the legal walls near the pawns or the placed walls.
+        Returns the pawn candidate index, or `PAWN_CANDIDATES` + the wall index.
+        """
+        h_walls = walls[rows, 0::2].astype(np.int32)
+        v_walls = walls[rows, 1::2].astype(np.int32)
+        conflicts = (h_walls @ H_CONFLICTS.T > 0) | (v_walls @ V_CONFLICTS.T > 0)
+        near = NEAR_CELL[current[rows]] | NEAR_CELL[waiting[rows]] | near_walls[rows]
+        candidates = np.concatenate([pawn_valid[rows], np.repeat(near, 2, axis=1) & ~conflicts], axis=1)
+        choice = np.empty(len(rows), dtype=np.int64)
+        pending = np.arange(len(rows))
+        while len(pending):
+            picked = _pick(candidates[pending], rng)
+            choice[pending] = picked
+            wall_picks = picked >= PAWN_CANDIDATES
+            checked, wall = pending[wall_picks], picked[wall_picks] - PAWN_CANDIDATES
+            legal = self._keeps_goals_reachable(rows[checked], wall, cells, open_edges, distances)
+            candidates[checked[~legal], wall[~legal] + PAWN_CANDIDATES] = False
+            pending = checked[~legal]
+        return choice
+
+    def _keeps_goals_reachable(self, rows, wall, cells, open_edges, distances) -> np.ndarray:
+        """
+        Checks whether both players can still reach their goal rows after the given walls are placed.
+        A wall that only separates cells at the same distance from a goal row can't change the
+        distances, the rest are checked by new distance fields.
+        """
+        legal = np.ones(len(rows), dtype=bool)
+        if not len(rows):
+            return legal
+        edges = WALL_EDGES[wall]  # (games, 2 pairs, 2 cells)
+        row_distances = distances[rows]  # (games, 2 seats, cells)
+        seat_rows = np.arange(len(rows))[:, None, None]
+        seats = np.arange(2)[None, :, None]
+        first = row_distances[seat_rows, seats, edges[:, None, :, 0]]
+        second = row_distances[seat_rows, seats, edges[:, None, :, 1]]
+        unsafe = (first != second).any(axis=(1, 2))
+        if unsafe.any():
+            unsafe_rows = rows[unsafe]
+            boards = open_edges[unsafe_rows] & ~WALL_CUTS[wall[unsafe]]
+            new_distances = distance_fields(
+                np.repeat(boards, 2, axis=0), np.tile(self.goals, (len(unsafe_rows), 1))
+            ).reshape(len(unsafe_rows), 2, CELLS)
+            pawns = cells[unsafe_rows]
+            reachable = new_distances[np.arange(len(unsafe_rows))[:, None], np.arange(2)[None], pawns] < UNREACHABLE
+            legal[unsafe] = reachable.all(axis=1)
+        return legal
+
+
+def simulate_batch(game_state, num_to_simulate: int, first: int = 0,
+                   rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Plays random games from the given position in lockstep.
+
+    Parameters
+    ----------
+    game_state : Quoridor
+        The position to play from.
+    num_to_simulate : int
+        The number of games to play.
+    first : int, optional
+        The seat that moves first, 0 for the game's current player and 1 for the waiting one, by default 0.
+    rng : np.random.Generator, optional
+        The random generator, by default one seeded from the `random` module.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The seat of the winner and the number of moves of every game.
+    """
+    return BatchRollout(game_state).play(num_to_simulate, first, rng)
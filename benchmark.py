@@ -0,0 +1,294 @@
+"""
+Micro-benchmarks of the engine hot paths.
+
+Every case is timed on a fixed corpus of positions (an opening, a mid-game and a
+wall-saturated position) for each engine, and the results are written as JSON.
+A run can be compared with a stored baseline: a case regresses when its time per
+operation grew by more than its threshold.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.1 --case-threshold "*/get_action-depth-2=0.3"
+
+The legal moves and the shortest paths are cached by the engines, the caches are
+cleared before every timed call so the cases measure the generation itself.
+"""
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2
+from Heuristics import both_goals_evaluation_function
+from Players import AlphaBetaPlayer, Player, filter_moves
+from game_bitboard import BitboardQuoridor
+from game_faster import Quoridor
+
+# name -> PGN, every position has the first player to move
+POSITIONS: Dict[str, str] = {
+    "opening": "e2/e8",
+    "mid-game": "e2/e8/e3/e7/d6h/f3h/c5v/f7",
+    "wall-saturated": "e2/e8/e3/e7/d6h/f3h/c5v/f7/h5h/d4h/h2h/d8v/a3v/c3v/f6h/f4v/e5v/d2v/g3v/e7h",
+}
+
+ENGINES: Dict[str, type] = {"dict": Quoridor, "bitboard": BitboardQuoridor}
+
+# A case times operations on a position and returns (seconds, number of operations)
+Case = Callable[[Quoridor], Tuple[float, int]]
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Represents the timing of a case on a position.
+
+    Attributes
+    ----------
+    name : str
+        engine/position/case.
+    best_us : float
+        The time per operation of the fastest repeat, in microseconds.
+    median_us : float
+        The median time per operation over the repeats, in microseconds.
+    operations : int
+        The number of operations timed in a repeat.
+    """
+
+    name: str
+    best_us: float
+    median_us: float
+    operations: int
+
+
+@dataclass
+class Regression:
+    """
+    Represents a case that got slower than its baseline by more than its threshold.
+    """
+
+    name: str
+    baseline_us: float
+    current_us: float
+    threshold: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_us / self.baseline_us
+
+
+def _position(engine: type, pgn: str, player1: Optional[Player] = None) -> Quoridor:
+    game_state = engine(player1 or Player(1, START_POS_P1, GOAL_P1), Player(2, START_POS_P2, GOAL_P2))
+    for move in pgn.split("/"):
+        game_state.make_move(move)
+    return game_state
+
+
+def _sample_moves(game_state: Quoridor) -> List[str]:
+    """
+    The pawn moves and every 4th legal wall, in a fixed order
+    """
+    return sorted(game_state.get_legal_pawn_moves()) + game_state.get_legal_wall_moves()[::4]
+
+
+def _time_calls(call: Callable[[], object], clear: Callable[[], None], number: int) -> Tuple[float, int]:
+    elapsed = 0.0
+    for _ in range(number):
+        clear()
+        start = time.perf_counter()
+        call()
+        elapsed += time.perf_counter() - start
+    return elapsed, number
+
+
+def _time_make_move(game_state: Quoridor) -> Tuple[float, int]:
+    moves = _sample_moves(game_state)
+    elapsed = 0.0
+    for move in moves:
+        start = time.perf_counter()
+        game_state.make_move(move)
+        elapsed += time.perf_counter() - start
+        game_state.undo_move()
+    return elapsed, len(moves)
+
+
+def _time_undo_move(game_state: Quoridor) -> Tuple[float, int]:
+    moves = _sample_moves(game_state)
+    elapsed = 0.0
+    for move in moves:
+        game_state.make_move(move)
+        start = time.perf_counter()
+        game_state.undo_move()
+        elapsed += time.perf_counter() - start
+    return elapsed, len(moves)
+
+
+def _time_legal_pawn_moves(game_state: Quoridor) -> Tuple[float, int]:
+    return _time_calls(game_state.get_legal_pawn_moves, game_state._legal_moves_cache.clear, 200)
+
+
+def _time_legal_wall_moves(game_state: Quoridor) -> Tuple[float, int]:
+    return _time_calls(game_state.get_legal_wall_moves, game_state._legal_moves_cache.clear, 20)
+
+
+def _time_shortest_path(game_state: Quoridor) -> Tuple[float, int]:
+    player = game_state.current_player
+    return _time_calls(lambda: game_state.get_shortest_path(player.pos, player.goal),
+                       game_state._clear_wall_caches, 200)
+
+
+def _time_filter_moves(game_state: Quoridor) -> Tuple[float, int]:
+    return _time_calls(lambda: filter_moves(game_state), game_state._legal_moves_cache.clear, 20)
+
+
+def _alphabeta_case(depth: int) -> Case:
+    def time_get_action(game_state: Quoridor) -> Tuple[float, int]:
+        # a fresh player and position, so no search state is kept between the repeats
+        random.seed(0)
+        player = AlphaBetaPlayer(1, START_POS_P1, GOAL_P1, lambda x: both_goals_evaluation_function(x, -1),
+                                 depth=depth)
+        search_state = _position(type(game_state), game_state.get_pgn(), player)
+        # the search prints its progress, which would mix with the report
+        with player, contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            player.get_action(search_state)
+            elapsed = time.perf_counter() - start
+        return elapsed, 1
+    return time_get_action
+
+
+CASES: Dict[str, Case] = {
+    "make_move": _time_make_move,
+    "undo_move": _time_undo_move,
+    "get_legal_pawn_moves": _time_legal_pawn_moves,
+    "get_legal_wall_moves": _time_legal_wall_moves,
+    "get_shortest_path": _time_shortest_path,
+    "filter_moves": _time_filter_moves,
+    "get_action-depth-1": _alphabeta_case(1),
+    "get_action-depth-2": _alphabeta_case(2),
+}
+
+
+def run_benchmarks(engines: Optional[List[str]] = None, pattern: str = "*", repeat: int = 5) -> List[BenchmarkResult]:
+    """
+    Times the cases on every position of the corpus.
+
+    Parameters
+    ----------
+    engines : list of str, optional
+        The names of the engines in `ENGINES`, by default all of them.
+    pattern : str, optional
+        A glob that selects the cases by name (engine/position/case), by default all of them.
+    repeat : int, optional
+        The number of times every case is timed, by default 5.
+
+    Returns
+    -------
+    list of BenchmarkResult
+        The results of the selected cases.
+    """
+    results = []
+    for engine_name in engines or ENGINES:
+        for position_name, pgn in POSITIONS.items():
+            for case_name, case in CASES.items():
+                name = f"{engine_name}/{position_name}/{case_name}"
+                if not fnmatch.fnmatch(name, pattern):
+                    continue
+                per_operation = []
+                for _ in range(repeat):
+                    elapsed, operations = case(_position(ENGINES[engine_name], pgn))
+                    per_operation.append(elapsed / operations * 1e6)
+                results.append(BenchmarkResult(name, min(per_operation), statistics.median(per_operation),
+                                               operations))
+    return results
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict[str, dict], threshold: float = 0.1,
+            case_thresholds: Optional[Dict[str, float]] = None) -> List[Regression]:
+    """
+    Finds the cases that are slower than the baseline by more than their threshold.
+    The best times are compared, they are the least sensitive to other load on the machine.
+
+    Parameters
+    ----------
+    results : list of BenchmarkResult
+        The current results.
+    baseline : dict
+        The "results" of a stored JSON report, cases missing from it are skipped.
+    threshold : float, optional
+        The allowed relative slowdown, by default 0.1 (10%).
+    case_thresholds : dict of str to float, optional
+        Thresholds of the cases that match a glob, the first matching glob is used.
+
+    Returns
+    -------
+    list of Regression
+        The regressed cases.
+    """
+    regressions = []
+    for result in results:
+        if result.name not in baseline:
+            continue
+        case_threshold = next((value for pattern, value in (case_thresholds or {}).items()
+                               if fnmatch.fnmatch(result.name, pattern)), threshold)
+        baseline_us = baseline[result.name]["best_us"]
+        if result.best_us > baseline_us * (1 + case_threshold):
+            regressions.append(Regression(result.name, baseline_us, result.best_us, case_threshold))
+    return regressions
+
+
+def report(results: List[BenchmarkResult]) -> dict:
+    """
+    The JSON report of the results, keyed by case name.
+    """
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {result.name: asdict(result) for result in results},
+    }
+
+
+def _parse_case_threshold(value: str) -> Tuple[str, float]:
+    pattern, _, threshold = value.rpartition("=")
+    return pattern, float(threshold)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Times the engine hot paths on a fixed corpus of positions")
+    parser.add_argument("--engine", action="append", choices=list(ENGINES), help="engine to time, repeatable")
+    parser.add_argument("--filter", default="*", help="glob over engine/position/case names")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare with, exits with 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    parser.add_argument("--case-threshold", action="append", default=[], type=_parse_case_threshold,
+                        metavar="GLOB=THRESHOLD", help="threshold of the matching cases, repeatable")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.engine, args.filter, args.repeat)
+    output = json.dumps(report(results), indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold, dict(args.case_threshold))
+        for regression in regressions:
+            print(f"{regression.name}: {regression.baseline_us:.1f} -> {regression.current_us:.1f} us "
+                  f"({regression.ratio:.2f}x, threshold {regression.threshold:.0%})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
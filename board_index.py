@@ -0,0 +1,116 @@
+"""
+Index tables of the board geometry, shared by the bitboard engine, the rollouts and the players.
+
+Cells are numbered ``row * 9 + column`` and wall slots ``row * 8 + column`` of the
+wall's lower-left cell. The module only depends on `Constants`, so any module can
+import it without importing the engines.
+"""
+import string
+from typing import Dict, List, Tuple
+
+from Constants import POSSIBLE_WALLS
+
+BOARD_SIZE: int = 9
+WALL_SIZE: int = 8
+FULL_BOARD: int = (1 << (BOARD_SIZE * BOARD_SIZE)) - 1
+
+CELL_NAMES: List[str] = [
+    string.ascii_letters[col] + str(row + 1)
+    for row in range(BOARD_SIZE)
+    for col in range(BOARD_SIZE)
+]
+CELL_INDEX: Dict[str, int] = {name: index for index, name in enumerate(CELL_NAMES)}
+
+ROW_MASKS: List[int] = [
+    sum(1 << (row * BOARD_SIZE + col) for col in range(BOARD_SIZE))
+    for row in range(BOARD_SIZE)
+]
+COL_MASKS: List[int] = [
+    sum(1 << (row * BOARD_SIZE + col) for row in range(BOARD_SIZE))
+    for col in range(BOARD_SIZE)
+]
+# goal (as stored on the players) -> mask of the goal row
+GOAL_MASKS: Dict[str, int] = {str(row + 1): ROW_MASKS[row] for row in range(BOARD_SIZE)}
+
+# Open edge masks of the empty board, a set bit means the move in that
+# direction out of the cell is not blocked
+OPEN_UP: int = FULL_BOARD & ~ROW_MASKS[-1]
+OPEN_DOWN: int = FULL_BOARD & ~ROW_MASKS[0]
+OPEN_RIGHT: int = FULL_BOARD & ~COL_MASKS[-1]
+OPEN_LEFT: int = FULL_BOARD & ~COL_MASKS[0]
+
+# steps of the up, down, right and left moves
+DIRECTION_STEPS: Tuple[int, ...] = (BOARD_SIZE, -BOARD_SIZE, 1, -1)
+
+
+def _wall_slot(wall: str) -> int:
+    return (int(wall[1]) - 1) * WALL_SIZE + ord(wall[0]) - ord("a")
+
+
+def _wall_edges(wall: str) -> Tuple[int, int, int, int]:
+    """
+    Returns the cells whose edges are cut by the given wall as masks of the
+    form (up, down, right, left), matching the open edge masks.
+    """
+    slot = _wall_slot(wall)
+    row, col = divmod(slot, WALL_SIZE)
+    lower_left = row * BOARD_SIZE + col
+    lower = (1 << lower_left) | (1 << (lower_left + 1))
+    left = (1 << lower_left) | (1 << (lower_left + BOARD_SIZE))
+    if wall[2] == "h":
+        return lower, lower << BOARD_SIZE, 0, 0
+    return 0, 0, left, left << 1
+
+
+def _wall_conflicts(wall: str) -> Tuple[int, int]:
+    """
+    Returns the horizontal and vertical wall masks that can't coexist with the
+    given wall (the wall itself, the walls it overlaps and the crossing wall).
+    """
+    slot = _wall_slot(wall)
+    row, col = divmod(slot, WALL_SIZE)
+    same = 1 << slot
+    if wall[2] == "h":
+        neighbours = same
+        if col > 0:
+            neighbours |= same >> 1
+        if col < WALL_SIZE - 1:
+            neighbours |= same << 1
+        return neighbours, same
+    neighbours = same
+    if row > 0:
+        neighbours |= same >> WALL_SIZE
+    if row < WALL_SIZE - 1:
+        neighbours |= same << WALL_SIZE
+    return same, neighbours
+
+
+# wall slot -> (horizontal wall name, vertical wall name)
+SLOT_WALLS: List[Tuple[str, str]] = [
+    (string.ascii_letters[col] + str(row + 1) + "h", string.ascii_letters[col] + str(row + 1) + "v")
+    for row in range(WALL_SIZE)
+    for col in range(WALL_SIZE)
+]
+
+
+def _near_slots(col: int, row: int) -> int:
+    """
+    Returns the mask of the wall slots at distance of at most 1 from the given
+    column and row (the distance of `Players.dist_from_cell`).
+    """
+    return sum(
+        1 << (slot_row * WALL_SIZE + slot_col)
+        for slot_row in range(max(row - 1, 0), min(row + 2, WALL_SIZE))
+        for slot_col in range(max(col - 1, 0), min(col + 2, WALL_SIZE))
+    )
+
+
+# Spatial index of the wall neighbourhoods, the slots near each cell and near each slot
+NEAR_CELL_SLOTS: List[int] = [_near_slots(index % BOARD_SIZE, index // BOARD_SIZE) for index in range(BOARD_SIZE ** 2)]
+NEAR_WALL_SLOTS: List[int] = [_near_slots(slot % WALL_SIZE, slot // WALL_SIZE) for slot in range(WALL_SIZE ** 2)]
+
+# wall name -> (is horizontal, slot bit, cut edges, conflicting walls)
+WALL_TABLE: Dict[str, Tuple[bool, int, Tuple[int, int, int, int], Tuple[int, int]]] = {
+    wall: (wall[2] == "h", 1 << _wall_slot(wall), _wall_edges(wall), _wall_conflicts(wall))
+    for wall in POSSIBLE_WALLS
+}
@@ -92,3 +92,18 @@ class NothingToUndoError(Exception):
     def __init__(self, message="There is nothing to undo"):
         self.message = message
         super().__init__(self.message)
+
+
+class SearchTimeoutError(Exception):
+    """
+    Exception raised when a search runs out of its time budget.
+
+    Parameters
+    ----------
+    message : str, optional
+        The error message to display. Defaults to "Search time budget exceeded".
+    """
+
+    def __init__(self, message="Search time budget exceeded"):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,549 @@
+"""
+Bitboard backend for the Quoridor game.
+
+Pawn positions are stored as cell indices (``row * 9 + column``) and the walls
+are stored as two 64-bit masks, one for horizontal and one for vertical walls
+(``row * 8 + column`` of the wall's lower-left cell). Edge blocking is kept in
+four 81-bit "open edge" masks, so neighbour lookups, jump checks and
+reachability searches are plain integer bit operations.
+
+`BitboardQuoridor` keeps the public API of `game_faster.Quoridor`, so the
+players and heuristics can use it as a drop-in replacement.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from Constants import ALL_QUORIDOR_MOVES_REGEX, POSSIBLE_WALLS, GameStatus
+from board_index import (
+    BOARD_SIZE,
+    CELL_INDEX,
+    CELL_NAMES,
+    DIRECTION_STEPS,
+    GOAL_MASKS,
+    OPEN_DOWN,
+    OPEN_LEFT,
+    OPEN_RIGHT,
+    OPEN_UP,
+    WALL_TABLE,
+)
+from exceptions import (
+    InvalidMoveError,
+    IllegalPawnMoveError,
+    IllegalWallPlacementError,
+    NoWallToPlaceError,
+    NothingToUndoError,
+)
+from game_faster import Quoridor, ZOBRIST_SIDE
+
+
+def flood_reaches(start: int, target: int, up: int, down: int, right: int, left: int) -> bool:
+    """
+    Bit-parallel breadth first search, checks whether any cell of the target
+    mask can be reached from the start mask.
+
+    Parameters
+    ----------
+    start : int
+        Mask of the cells the search starts from.
+    target : int
+        Mask of the cells that should be reached.
+    up, down, right, left : int
+        Open edge masks of the board.
+
+    Returns
+    -------
+    bool
+        True if the target is reachable, False otherwise.
+    """
+    reached = frontier = start
+    while frontier:
+        if reached & target:
+            return True
+        frontier = (
+            ((frontier & up) << BOARD_SIZE)
+            | ((frontier & down) >> BOARD_SIZE)
+            | ((frontier & right) << 1)
+            | ((frontier & left) >> 1)
+        ) & ~reached
+        reached |= frontier
+    return False
+
+
+def flood_layers(start: int, up: int, down: int, right: int, left: int) -> List[int]:
+    """
+    Bit-parallel breadth first search that returns the masks of the BFS layers.
+
+    Parameters
+    ----------
+    start : int
+        Mask of the cells the search starts from.
+    up, down, right, left : int
+        Open edge masks of the board.
+
+    Returns
+    -------
+    list of int
+        The BFS layers, the i-th one holds the cells at distance i from the start.
+    """
+    layers = []
+    reached = frontier = start
+    while frontier:
+        layers.append(frontier)
+        frontier = (
+            ((frontier & up) << BOARD_SIZE)
+            | ((frontier & down) >> BOARD_SIZE)
+            | ((frontier & right) << 1)
+            | ((frontier & left) >> 1)
+        ) & ~reached
+        reached |= frontier
+    return layers
+
+
+def neighbour_cells(cell: int, up: int, down: int, right: int, left: int) -> List[int]:
+    """
+    Returns the cells adjacent to the given cell that are not separated by a wall.
+    """
+    neighbours = []
+    if up >> cell & 1:
+        neighbours.append(cell + BOARD_SIZE)
+    if down >> cell & 1:
+        neighbours.append(cell - BOARD_SIZE)
+    if right >> cell & 1:
+        neighbours.append(cell + 1)
+    if left >> cell & 1:
+        neighbours.append(cell - 1)
+    return neighbours
+
+
+def pawn_destinations(current: int, waiting: int, up: int, down: int, right: int, left: int) -> List[int]:
+    """
+    Returns the cells the pawn on the current cell can move to, when the other
+    pawn is on the waiting cell.
+    """
+    cells = []
+    for direction, open_edges in enumerate((up, down, right, left)):
+        if not open_edges >> current & 1:
+            continue
+        cell = current + DIRECTION_STEPS[direction]
+        if cell != waiting:
+            cells.append(cell)
+        elif open_edges >> waiting & 1:
+            # jump over the opponent
+            cells.append(waiting + DIRECTION_STEPS[direction])
+        else:
+            # the jump is blocked, step to the sides of the opponent
+            cells.extend(
+                neighbour for neighbour in neighbour_cells(waiting, up, down, right, left)
+                if neighbour != current
+            )
+    return cells
+
+
+def descend_path(start: int, layers: List[int], up: int, down: int, right: int, left: int) -> List[int]:
+    """
+    Walks from the start cell down the distance layers of a goal row (see
+    `flood_layers`), returns the cells of a shortest path to the goal row or an
+    empty list if the start can't reach it.
+    """
+    for distance, layer in enumerate(layers):
+        if layer >> start & 1:
+            break
+    else:
+        return []
+    cell = start
+    path = [cell]
+    # every cell has a neighbour one step closer to the goal
+    for layer in reversed(layers[:distance]):
+        for neighbour in neighbour_cells(cell, up, down, right, left):
+            if layer >> neighbour & 1:
+                cell = neighbour
+                break
+        path.append(cell)
+    return path
+
+
+def path_edge_masks(path: List[int]) -> Tuple[int, int]:
+    """
+    Returns the edges crossed by the given path, as the masks of the cells whose
+    upper / right edge the path crosses (the same form as the walls' cut edges).
+    """
+    up = right = 0
+    for source, target in zip(path, path[1:]):
+        step = target - source
+        if step == BOARD_SIZE:
+            up |= 1 << source
+        elif step == -BOARD_SIZE:
+            up |= 1 << target
+        elif step == 1:
+            right |= 1 << source
+        else:
+            right |= 1 << target
+    return up, right
+
+
+class BitboardQuoridor(Quoridor):
+    """
+    Represents a game of Quoridor, backed by bitboards.
+
+    Attributes
+    ----------
+    h_walls : int
+        64-bit mask of the placed horizontal walls.
+    v_walls : int
+        64-bit mask of the placed vertical walls.
+    open_up, open_down, open_right, open_left : int
+        81-bit masks of the cells that can be left in each direction.
+    board : dict of str and set of str
+        Adjacency view of the board, built on demand for compatibility.
+
+    The rest of the attributes are the same as `Quoridor`'s.
+    """
+
+    def _init_board(self) -> None:
+        self.h_walls = 0
+        self.v_walls = 0
+        self.open_up = OPEN_UP
+        self.open_down = OPEN_DOWN
+        self.open_right = OPEN_RIGHT
+        self.open_left = OPEN_LEFT
+        self.current_cell = CELL_INDEX[self.player1.pos]
+        self.waiting_cell = CELL_INDEX[self.player2.pos]
+        # (cell, goal) -> (up, right) edge masks of a shortest path, valid until the walls change
+        self._path_witnesses: Dict[Tuple[int, str], Tuple[int, int]] = {}
+        # goal -> masks of the cells at each distance from the goal row, valid until the walls change
+        self._distance_fields: Dict[str, List[int]] = {}
+
+    @property
+    def board(self) -> Dict[str, Set[str]]:
+        board = {}
+        for index, name in enumerate(CELL_NAMES):
+            board[name] = {CELL_NAMES[neighbour] for neighbour in self._neighbours(index)}
+        return board
+
+    def get_state_key(self) -> int:
+        return self._pack_state_key(self.h_walls, self.v_walls)
+
+    def _apply_move(self, move: str):
+        """
+        Makes a move that is known to be legal, without validating it (e.g. when replaying a game).
+        """
+        self.moves.append(move)
+        self._push_version()
+
+        if len(move) == 2:
+            self._make_pawn_move(move)
+            if self.current_player.pos[1] == self.current_player.goal:
+                self.status = GameStatus.COMPLETED
+                self._switch_player()
+                return
+        else:
+            self._make_wall_move(None, move)
+        self._switch_player()
+
+    def validate_move(self, move: str):
+        """
+        Validates the given move string and raises an InvalidMoveError if it is invalid.
+        """
+        if move in CELL_INDEX:
+            self._validate_pawn_move(move)
+        elif move in WALL_TABLE:
+            self._validate_wall_move(move)
+        elif ALL_QUORIDOR_MOVES_REGEX.fullmatch(move):
+            # walls on the last row / column match the regex but are out of bounds
+            if self.current_player.walls == 0:
+                raise NoWallToPlaceError()
+            raise IllegalWallPlacementError(
+                message="Illegal wall placement, wall out of bounds"
+            )
+        else:
+            raise InvalidMoveError()
+
+    def undo_move(self):
+        """
+        Undo the last move played in the game.
+
+        Raises
+        ------
+        NothingToUndoError
+            If there are no moves to undo.
+        """
+        if len(self.moves) == 0:
+            raise NothingToUndoError()
+        last_move = self.moves.pop()
+        self._versions.pop()
+        if len(last_move) == 2:
+            source = self.waiting_player.pos
+            self.waiting_player.pos = self.waiting_player.position_history.pop()
+            self.waiting_cell = CELL_INDEX[self.waiting_player.pos]
+            self._hash_pawn_move(self.waiting_player, source, self.waiting_player.pos)
+        else:
+            self.waiting_player.walls += 1
+            wall = self.placed_walls.pop()
+            self.waiting_player.placed_walls.pop()
+            self._hash_wall_move(self.waiting_player, wall, self.waiting_player.walls - 1)
+            is_horizontal, bit, (up, down, right, left), _ = WALL_TABLE[wall]
+            if is_horizontal:
+                self.h_walls &= ~bit
+            else:
+                self.v_walls &= ~bit
+            self.open_up |= up
+            self.open_down |= down
+            self.open_right |= right
+            self.open_left |= left
+            self._clear_wall_caches()
+
+        self._switch_player()
+        self.status = GameStatus.ONGOING
+
+    def _switch_player(self) -> None:
+        """
+        Swaps the current player and waiting player.
+        """
+        self.current_player, self.waiting_player = self.waiting_player, self.current_player
+        self.current_cell, self.waiting_cell = self.waiting_cell, self.current_cell
+        self._zobrist_hash ^= ZOBRIST_SIDE
+
+    def _validate_pawn_move(self, move):
+        """
+        Validates if the specified pawn move is legal.
+
+        Raises:
+        -------
+        IllegalPawnMoveError
+            If the move is not legal.
+        """
+        if CELL_INDEX[move] not in self._legal_pawn_cells():
+            raise IllegalPawnMoveError()
+
+    def _validate_wall_move(self, move):
+        """
+        Validates if the specified wall move is legal.
+
+        Raises:
+        -------
+        NoWallToPlaceError
+            If the current player has no walls to place.
+        IllegalWallPlacementError
+            If the wall overlaps with another wall, or
+            blocks one of the players from reaching their goal.
+        """
+        if self.current_player.walls == 0:
+            raise NoWallToPlaceError()
+        if self._wall_overlaps(move):
+            raise IllegalWallPlacementError(
+                message="Illegal wall placements, wall overlaps with another wall"
+            )
+        cut_up, cut_down, cut_right, cut_left = WALL_TABLE[move][2]
+        up = self.open_up & ~cut_up
+        down = self.open_down & ~cut_down
+        right = self.open_right & ~cut_right
+        left = self.open_left & ~cut_left
+        path_up, path_right = self._path_witness(self.current_cell, self.current_player.goal)
+        if (path_up & cut_up or path_right & cut_right) and not flood_reaches(
+                1 << self.current_cell, GOAL_MASKS[self.current_player.goal], up, down, right, left):
+            raise IllegalWallPlacementError(
+                message="Illegal wall placement, you cannot reach your goal"
+            )
+        path_up, path_right = self._path_witness(self.waiting_cell, self.waiting_player.goal)
+        if (path_up & cut_up or path_right & cut_right) and not flood_reaches(
+                1 << self.waiting_cell, GOAL_MASKS[self.waiting_player.goal], up, down, right, left):
+            raise IllegalWallPlacementError(
+                message="Illegal wall placement, opponent cannot reach goal"
+            )
+
+    def _wall_overlaps(self, wall: str) -> bool:
+        """
+        Check if the given wall overlaps with (or crosses) a previously placed wall.
+        """
+        h_conflicts, v_conflicts = WALL_TABLE[wall][3]
+        return bool(self.h_walls & h_conflicts or self.v_walls & v_conflicts)
+
+    def _path_witness(self, cell: int, goal: str) -> Tuple[int, int]:
+        """
+        Get the edges of a shortest path from the given cell to the goal, as
+        the masks of the cells whose upper / right edge the path crosses.
+        As long as a wall doesn't cut one of these edges, the goal stays reachable.
+
+        The witnesses are cached until a wall is placed or removed.
+        """
+        witness = self._path_witnesses.get((cell, goal))
+        if witness is None:
+            witness = self._path_witnesses[(cell, goal)] = path_edge_masks(
+                self._shortest_path_cells(cell, goal)
+            )
+        return witness
+
+    def wall_cuts_path(self, wall: str, pos: str, goal: str) -> bool:
+        """
+        Check if the given wall cuts the (cached) shortest path from the given
+        position to the goal. Only such walls can make the shortest path longer.
+        """
+        path_up, path_right = self._path_witness(CELL_INDEX[pos], goal)
+        cut_up, _, cut_right, _ = WALL_TABLE[wall][2]
+        return bool(path_up & cut_up or path_right & cut_right)
+
+    def get_shortest_path(self, start: str, goal: str) -> List[str]:
+        """
+        Find the shortest path from start to goal on the Quoridor board.
+
+        Parameters:
+        -----------
+        start : str
+            The starting position (e.g., 'e1').
+        goal : str
+            The goal row (e.g., '9').
+
+        Returns:
+        --------
+        List[str]
+            A list of positions representing the shortest path from start to goal.
+            Returns an empty list if no path is found.
+        """
+        return [CELL_NAMES[cell] for cell in self._shortest_path_cells(CELL_INDEX[start], goal)]
+
+    def get_shortest_path_length(self, start: str, goal: str) -> int:
+        """
+        Get the length of the shortest path from start to goal, i.e.
+        `len(self.get_shortest_path(start, goal))`, without building the path.
+        """
+        distance = self._goal_distance(CELL_INDEX[start], goal)
+        return 0 if distance is None else distance + 1
+
+    def get_distance_field(self, goal: str) -> Dict[str, int]:
+        """
+        Get the distance of every cell from the goal row. Cells that can't
+        reach the goal row are missing.
+        """
+        return {
+            CELL_NAMES[cell]: distance
+            for distance, layer in enumerate(self._distance_layers(goal))
+            for cell in range(BOARD_SIZE * BOARD_SIZE)
+            if layer >> cell & 1
+        }
+
+    def _distance_layers(self, goal: str) -> List[int]:
+        """
+        Get the masks of the cells at each distance from the goal row, computed
+        by a bit-parallel breadth first search starting from the whole goal row.
+
+        The layers are cached until a wall is placed or removed.
+        """
+        layers = self._distance_fields.get(goal)
+        if layers is None:
+            layers = self._distance_fields[goal] = flood_layers(
+                GOAL_MASKS[goal], self.open_up, self.open_down, self.open_right, self.open_left
+            )
+        return layers
+
+    def _goal_distance(self, cell: int, goal: str) -> Optional[int]:
+        """
+        Get the number of steps from the given cell to the goal row, None if
+        the goal row can't be reached.
+        """
+        for distance, layer in enumerate(self._distance_layers(goal)):
+            if layer >> cell & 1:
+                return distance
+        return None
+
+    def _shortest_path_cells(self, start: int, goal: str) -> List[int]:
+        """
+        Find the shortest path from the start cell to the goal row, as cell indices.
+        """
+        return descend_path(start, self._distance_layers(goal),
+                            self.open_up, self.open_down, self.open_right, self.open_left)
+
+    def _clear_wall_caches(self) -> None:
+        """
+        Clear the cached path witnesses and distance fields, called whenever
+        the walls on the board change.
+        """
+        self._path_witnesses.clear()
+        self._distance_fields.clear()
+
+    def _is_reachable(self, board, player_pos, player_goal) -> bool:
+        """
+        Determines if the player can reach their goal from their current
+        position. The board argument is ignored, the bitboards are used instead.
+        """
+        return flood_reaches(1 << CELL_INDEX[player_pos], GOAL_MASKS[player_goal],
+                             self.open_up, self.open_down, self.open_right, self.open_left)
+
+    def _make_pawn_move(self, move: str):
+        """
+        Makes a move for the current player by moving their pawn to
+        the specified position on the board.
+        """
+        self.current_player.position_history.append(self.current_player.pos)
+        self._hash_pawn_move(self.current_player, self.current_player.pos, move)
+        self.current_player.pos = move
+        self.current_cell = CELL_INDEX[move]
+
+    def _make_wall_move(self, board, wall: str):
+        """
+        Make a wall move for the current player. The board argument is
+        ignored, it is kept for compatibility with `Quoridor`.
+        """
+        self.placed_walls.append(wall)
+        self.current_player.placed_walls.append(wall)
+        self.current_player.walls -= 1
+        self._hash_wall_move(self.current_player, wall, self.current_player.walls + 1)
+
+        is_horizontal, bit, (up, down, right, left), _ = WALL_TABLE[wall]
+        if is_horizontal:
+            self.h_walls |= bit
+        else:
+            self.v_walls |= bit
+        self.open_up &= ~up
+        self.open_down &= ~down
+        self.open_right &= ~right
+        self.open_left &= ~left
+        self._clear_wall_caches()
+
+    def _neighbours(self, cell: int) -> List[int]:
+        """
+        Returns the cells adjacent to the given cell that are not separated by a wall.
+        """
+        return neighbour_cells(cell, self.open_up, self.open_down, self.open_right, self.open_left)
+
+    def _legal_pawn_cells(self) -> List[int]:
+        """
+        Returns the cells the current player's pawn can move to.
+        """
+        return pawn_destinations(self.current_cell, self.waiting_cell,
+                                 self.open_up, self.open_down, self.open_right, self.open_left)
+
+    def _generate_legal_pawn_moves(self) -> Set[str]:
+        """
+        Generate the legal moves for the current player's pawn.
+        """
+        return {CELL_NAMES[cell] for cell in self._legal_pawn_cells()}
+
+    def _generate_legal_wall_moves(self) -> List[str]:
+        """
+        Generate the legal wall moves for the current player.
+        """
+        legal_walls = []
+        if self.current_player.walls == 0:
+            return legal_walls
+        h_walls, v_walls = self.h_walls, self.v_walls
+        open_up, open_down = self.open_up, self.open_down
+        open_right, open_left = self.open_right, self.open_left
+        current, current_goal = 1 << self.current_cell, GOAL_MASKS[self.current_player.goal]
+        waiting, waiting_goal = 1 << self.waiting_cell, GOAL_MASKS[self.waiting_player.goal]
+        current_up, current_right = self._path_witness(self.current_cell, self.current_player.goal)
+        waiting_up, waiting_right = self._path_witness(self.waiting_cell, self.waiting_player.goal)
+        for wall in POSSIBLE_WALLS:
+            _, _, (cut_up, cut_down, cut_right, cut_left), (h_conflicts, v_conflicts) = WALL_TABLE[wall]
+            if h_walls & h_conflicts or v_walls & v_conflicts:
+                continue
+            current_cut = current_up & cut_up or current_right & cut_right
+            waiting_cut = waiting_up & cut_up or waiting_right & cut_right
+            if current_cut or waiting_cut:
+                up, down = open_up & ~cut_up, open_down & ~cut_down
+                right, left = open_right & ~cut_right, open_left & ~cut_left
+                if current_cut and not flood_reaches(current, current_goal, up, down, right, left):
+                    continue
+                if waiting_cut and not flood_reaches(waiting, waiting_goal, up, down, right, left):
+                    continue
+            legal_walls.append(wall)
+        return legal_walls
@@ -5,10 +5,9 @@ All right reserved to the original writer due to MIT license
 """
 import random
 import string
-import copy
-from collections import deque
+from collections import OrderedDict, deque
 from dataclasses import dataclass
-from typing import Optional, Dict, List, Set
+from typing import Optional, Dict, List, Set, Tuple
 import matplotlib.pyplot as plt
 
 import numpy as np
@@ -28,6 +27,34 @@ from exceptions import (
 )
 from rewards import GAME_END, MOVE_AWAY_FROM_GOAL, MOVE_TOWARDS_GOAL, PLACE_WALL
 
+# Zobrist keys, drawn from a fixed seed so hashes are the same in every process
+_zobrist_random = random.Random(0x9E3779B97F4A7C15)
+ZOBRIST_PAWNS: List[Dict[str, int]] = [
+    {
+        string.ascii_letters[i] + str(j): _zobrist_random.getrandbits(64)
+        for i in range(9)
+        for j in range(1, 10)
+    }
+    for _ in range(2)
+]
+ZOBRIST_WALLS: Dict[str, int] = {wall: _zobrist_random.getrandbits(64) for wall in POSSIBLE_WALLS}
+ZOBRIST_WALL_COUNTS: List[List[int]] = [
+    [_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(2)
+]
+ZOBRIST_SIDE: int = _zobrist_random.getrandbits(64)
+
+# Layout of the state key, from the low bits: horizontal wall slots (64 bits), vertical wall slots (64 bits),
+# the cells of the pawns (7 bits each), the walls left to each player (4 bits each) and the side to move
+STATE_KEY_WALLS_MASK: int = (1 << 128) - 1
+STATE_KEY_PAWNS_SHIFT: int = 128
+STATE_KEY_WALL_COUNTS_SHIFT: int = 142
+STATE_KEY_SIDE_SHIFT: int = 150
+# Largest number of walls left to a player that fits in the state key
+STATE_KEY_MAX_WALLS: int = 15
+
+# Number of positions whose legal moves are kept, enough for the path of a deep search and its siblings
+LEGAL_MOVES_CACHE_SIZE: int = 64
+
 
 @dataclass
 class GameResult:
@@ -87,7 +114,6 @@ class Quoridor:
     """
 
     def __init__(self, player1: Player, player2: Player) -> None:
-        self.board: Dict[str, set[str]] = self._create_board()
         self.player1 = player1
         self.player2 = player2
 
@@ -98,6 +124,24 @@ class Quoridor:
         self.status = GameStatus.ONGOING
         self.is_terminated = False
         self.winner = 0
+        self._init_board()
+        self._zobrist_hash = self._compute_zobrist_hash()
+        # version of every position on the move stack, the last one is the current position's
+        self._versions: List[int] = [0]
+        self._version_counter = 0
+        # (version, whether player1 moves) -> [legal pawn moves, legal wall moves, wall -> whether it is legal],
+        # None until generated
+        self._legal_moves_cache: OrderedDict = OrderedDict()
+
+    def _init_board(self) -> None:
+        """
+        Sets up the empty board and the caches of its paths, engines with another board representation override it.
+        """
+        self.board: Dict[str, set[str]] = self._create_board()
+        # (position, goal) -> edges of a shortest path, valid until the walls change
+        self._path_witnesses: Dict[Tuple[str, str], Set[Tuple[str, str]]] = {}
+        # goal -> distance of every cell from the goal row, valid until the walls change
+        self._distance_fields: Dict[str, Dict[str, int]] = {}
 
     @classmethod
     def init_from_pgn(cls, pgn: str) -> "Quoridor":
@@ -127,6 +171,149 @@ class Quoridor:
             quoridor.make_move(move)
         return quoridor
 
+    def get_compact_state(self) -> tuple:
+        """
+        Returns a small picklable description of the game, used to send positions
+        to other processes. The players are described by their state at the start of
+        the game and the game by its PGN, so the position is rebuilt by replaying it.
+
+        Returns
+        -------
+        tuple
+            The engine class, the two players' (id, start position, goal, walls,
+            position history and placed walls from before the game), the index of
+            the player that made the first move and the PGN.
+        """
+        players = []
+        for player in (self.player1, self.player2):
+            # moves alternate, so the last move was made by the waiting player
+            own_moves = self.moves[-1::-2] if player is self.waiting_player else self.moves[-2::-2]
+            pawn_moves = sum(1 for move in own_moves if len(move) == 2)
+            wall_moves = len(own_moves) - pawn_moves
+            history = player.position_history[:len(player.position_history) - pawn_moves]
+            start = player.position_history[len(history)] if pawn_moves else player.pos
+            earlier_walls = player.placed_walls[:len(player.placed_walls) - wall_moves]
+            players.append(
+                (player.id, start, player.goal, player.walls + wall_moves, tuple(history), tuple(earlier_walls))
+            )
+        first_mover = self.current_player if len(self.moves) % 2 == 0 else self.waiting_player
+        return type(self), tuple(players), 0 if first_mover is self.player1 else 1, self.get_pgn()
+
+    @staticmethod
+    def from_compact_state(state: tuple) -> "Quoridor":
+        """
+        Rebuilds a game from the output of `get_compact_state`.
+        The players of the rebuilt game are plain `Player`s.
+        The moves were validated when they were played, so they are replayed without validation.
+
+        Parameters
+        ----------
+        state : tuple
+            The compact state of the game.
+
+        Returns
+        -------
+        Quoridor
+            A game in the same position, with the same move history.
+        """
+        engine, player_states, first_mover, pgn = state
+        players = [
+            Player(
+                id=player_id,
+                pos=start,
+                goal=goal,
+                walls=walls,
+                position_history=list(history),
+                placed_walls=list(earlier_walls),
+            )
+            for player_id, start, goal, walls, history, earlier_walls in player_states
+        ]
+        quoridor = engine(*players)
+        if first_mover == 1:
+            quoridor._switch_player()
+        if pgn:
+            for move in pgn.split("/"):
+                quoridor._apply_move(move)
+        return quoridor
+
+    @property
+    def zobrist_hash(self) -> int:
+        """
+        64-bit Zobrist hash of the position: pawn positions, placed walls,
+        remaining walls of each player and the side to move.
+        It is updated incrementally by every move and undo.
+        """
+        return self._zobrist_hash
+
+    def _compute_zobrist_hash(self) -> int:
+        """
+        Computes the Zobrist hash of the position from scratch.
+
+        Returns
+        -------
+        int
+            The 64-bit hash of the position.
+        """
+        zobrist_hash = 0
+        for slot, player in enumerate((self.player1, self.player2)):
+            zobrist_hash ^= ZOBRIST_PAWNS[slot][player.pos]
+            zobrist_hash ^= ZOBRIST_WALL_COUNTS[slot][player.walls]
+        for wall in self.placed_walls:
+            zobrist_hash ^= ZOBRIST_WALLS[wall]
+        if self.current_player is self.player2:
+            zobrist_hash ^= ZOBRIST_SIDE
+        return zobrist_hash
+
+    def get_state_key(self) -> int:
+        """
+        Compact canonical encoding of the position: pawn cells, placed walls,
+        remaining walls of each player and the side to move, packed into an int
+        (see `STATE_KEY_WALLS_MASK`). Equal positions have equal keys in every engine.
+
+        Returns
+        -------
+        int
+            The key of the position.
+        """
+        h_walls = v_walls = 0
+        for wall in self.placed_walls:
+            bit = 1 << ((int(wall[1]) - 1) * 8 + ord(wall[0]) - ord("a"))
+            if wall[2] == "h":
+                h_walls |= bit
+            else:
+                v_walls |= bit
+        return self._pack_state_key(h_walls, v_walls)
+
+    def _pack_state_key(self, h_walls: int, v_walls: int) -> int:
+        """
+        Packs the given wall masks with the pawns, wall counts and side to move into a state key.
+        Raises ValueError when a player has more walls than the key can hold (`STATE_KEY_MAX_WALLS`).
+        """
+        key = h_walls | v_walls << 64 | (self.current_player is self.player2) << STATE_KEY_SIDE_SHIFT
+        for slot, player in enumerate((self.player1, self.player2)):
+            if not 0 <= player.walls <= STATE_KEY_MAX_WALLS:
+                raise ValueError(f"The state key holds 0 to {STATE_KEY_MAX_WALLS} walls per player, "
+                                 f"player {player.id} has {player.walls}")
+            cell = (int(player.pos[1]) - 1) * 9 + ord(player.pos[0]) - ord("a")
+            key |= cell << (STATE_KEY_PAWNS_SHIFT + 7 * slot)
+            key |= player.walls << (STATE_KEY_WALL_COUNTS_SHIFT + 4 * slot)
+        return key
+
+    def _hash_pawn_move(self, player: Player, source: str, target: str) -> None:
+        """
+        Updates the Zobrist hash for a pawn of the given player moving between cells.
+        """
+        keys = ZOBRIST_PAWNS[0 if player is self.player1 else 1]
+        self._zobrist_hash ^= keys[source] ^ keys[target]
+
+    def _hash_wall_move(self, player: Player, wall: str, walls_before: int) -> None:
+        """
+        Updates the Zobrist hash for the given wall being placed or removed
+        by the given player, who had `walls_before` walls before the change.
+        """
+        keys = ZOBRIST_WALL_COUNTS[0 if player is self.player1 else 1]
+        self._zobrist_hash ^= ZOBRIST_WALLS[wall] ^ keys[walls_before] ^ keys[player.walls]
+
     def __repr__(self) -> str:
         return f"board: {self.board}"
 
@@ -241,7 +428,14 @@ class Quoridor:
             raise GameCompletedError()
 
         self.validate_move(move)
+        self._apply_move(move)
+
+    def _apply_move(self, move: str):
+        """
+        Makes a move that is known to be legal, without validating it (e.g. when replaying a game).
+        """
         self.moves.append(move)
+        self._push_version()
 
         if len(move) == 2:
             self._make_pawn_move(move)
@@ -288,33 +482,18 @@ class Quoridor:
         if len(self.moves) == 0:
             raise NothingToUndoError()
         last_move = self.moves.pop()
+        self._versions.pop()
         if len(last_move) == 2:
+            source = self.waiting_player.pos
             self.waiting_player.pos = self.waiting_player.position_history.pop()
+            self._hash_pawn_move(self.waiting_player, source, self.waiting_player.pos)
         else:
             self.waiting_player.walls += 1
             wall = self.placed_walls.pop()
             self.waiting_player.placed_walls.pop()
-            cell = wall[:2]
-            if wall[2] == "h":
-                connected_cells = [
-                    (cell, cell[0] + chr(ord(cell[1]) + 1)),
-                    (
-                        chr(ord(cell[0]) + 1) + cell[1],
-                        chr(ord(cell[0]) + 1) + chr(ord(cell[1]) + 1),
-                    ),
-                ]
-            else:
-                connected_cells = [
-                    (cell, chr(ord(cell[0]) + 1) + cell[1]),
-                    (
-                        cell[0] + chr(ord(cell[1]) + 1),
-                        chr(ord(cell[0]) + 1) + chr(ord(cell[1]) + 1),
-                    ),
-                ]
-            for cell_pair in connected_cells:
-                # remove cell connections
-                self.board[cell_pair[1]].add(cell_pair[0])
-                self.board[cell_pair[0]].add(cell_pair[1])
+            self._hash_wall_move(self.waiting_player, wall, self.waiting_player.walls - 1)
+            self._restore_connections(self.board, wall)
+            self._clear_wall_caches()
 
         self._switch_player()
         self.status = GameStatus.ONGOING
@@ -361,8 +540,9 @@ class Quoridor:
             status=self.status,
             total_moves=len(self.moves),
             placed_walls=self.placed_walls,
-            winner=self.current_player,
-            loser=self.waiting_player,
+            # the winner made the last move, so the players were switched after it
+            winner=self.waiting_player,
+            loser=self.current_player,
             pgn=self.get_pgn(),
         )
 
@@ -373,6 +553,7 @@ class Quoridor:
         waiting = self.current_player
         self.current_player = self.waiting_player
         self.waiting_player = waiting
+        self._zobrist_hash ^= ZOBRIST_SIDE
 
     def _validate_pawn_move(self, move):
         """
@@ -420,19 +601,38 @@ class Quoridor:
                 message="Illegal wall placements, wall overlaps with another wall"
             )
 
-        # check reachability for both players
-        copy_board = copy.deepcopy(self.board)
-        self._remove_connections(copy_board, move)
+        # a wall that doesn't cut a player's current shortest path can't block
+        # that player, so only the players whose path is cut are searched
+        wall_connections = self._wall_connections(move)
+        current_cut = not self._path_witness(
+            self.current_player.pos, self.current_player.goal
+        ).isdisjoint(wall_connections)
+        waiting_cut = not self._path_witness(
+            self.waiting_player.pos, self.waiting_player.goal
+        ).isdisjoint(wall_connections)
+        current_reachable = waiting_reachable = True
+
+        if current_cut or waiting_cut:
+            # check reachability, the wall is cut into the board in place
+            # and the connections are restored right after the search
+            self._remove_connections(self.board, move)
+            try:
+                if current_cut:
+                    current_reachable = self._is_reachable(
+                        self.board, self.current_player.pos, self.current_player.goal
+                    )
+                if waiting_cut and current_reachable:
+                    waiting_reachable = self._is_reachable(
+                        self.board, self.waiting_player.pos, self.waiting_player.goal
+                    )
+            finally:
+                self._restore_connections(self.board, move)
 
-        if not self._is_reachable(
-            copy_board, self.current_player.pos, self.current_player.goal
-        ):
+        if not current_reachable:
             raise IllegalWallPlacementError(
                 message="Illegal wall placement, you cannot reach your goal"
             )
-        if not self._is_reachable(
-            copy_board, self.waiting_player.pos, self.waiting_player.goal
-        ):
+        if not waiting_reachable:
             raise IllegalWallPlacementError(
                 message="Illegal wall placement, opponent cannot reach goal"
             )
@@ -454,20 +654,127 @@ class Quoridor:
             A list of positions representing the shortest path from start to goal.
             Returns an empty list if no path is found.
         """
-        queue = deque([(start, [start])])
-        visited = set()
+        distance_field = self.get_distance_field(goal)
+        if start not in distance_field:
+            return []  # No path found
+
+        path = [start]
+        vertex = start
+        # every cell that isn't on the goal row has a neighbor one step closer
+        for distance in range(distance_field[start] - 1, -1, -1):
+            for neighbor in self.board[vertex]:
+                if distance_field.get(neighbor) == distance:
+                    vertex = neighbor
+                    break
+            path.append(vertex)
+        return path
+
+    def get_shortest_path_length(self, start: str, goal: str) -> int:
+        """
+        Get the length of the shortest path from start to goal, i.e.
+        `len(self.get_shortest_path(start, goal))`, without building the path.
+
+        Parameters:
+        -----------
+        start : str
+            The starting position (e.g., 'e1').
+        goal : str
+            The goal row (e.g., '9').
+
+        Returns:
+        --------
+        int
+            The number of positions in the shortest path, including the start.
+            Returns 0 if no path is found.
+        """
+        distance = self.get_distance_field(goal).get(start)
+        return 0 if distance is None else distance + 1
+
+    def get_distance_field(self, goal: str) -> Dict[str, int]:
+        """
+        Get the distance of every cell from the goal row, computed by a
+        breadth first search that starts from all the cells of the goal row.
+
+        The fields are cached until a wall is placed or removed.
 
-        while queue:
-            (vertex, path) = queue.popleft()
-            if vertex not in visited:
-                if vertex[1] == goal:
-                    return path
-                visited.add(vertex)
+        Parameters:
+        -----------
+        goal : str
+            The goal row (e.g., '9').
+
+        Returns:
+        --------
+        Dict[str, int]
+            The number of steps from each cell to the goal row. Cells that
+            can't reach the goal row are missing.
+        """
+        distance_field = self._distance_fields.get(goal)
+        if distance_field is None:
+            distance_field = {cell: 0 for cell in self.board if cell[1] == goal}
+            queue = deque(distance_field)
+            while queue:
+                vertex = queue.popleft()
                 for neighbor in self.board[vertex]:
-                    if neighbor not in visited:
-                        queue.append((neighbor, path + [neighbor]))
+                    if neighbor not in distance_field:
+                        distance_field[neighbor] = distance_field[vertex] + 1
+                        queue.append(neighbor)
+            self._distance_fields[goal] = distance_field
+        return distance_field
+
+    def _clear_wall_caches(self) -> None:
+        """
+        Clear the cached path witnesses and distance fields, called whenever
+        the walls on the board change.
+        """
+        self._path_witnesses.clear()
+        self._distance_fields.clear()
+
+    def _path_witness(self, pos: str, goal: str) -> Set[Tuple[str, str]]:
+        """
+        Get the edges of a shortest path from the given position to the goal.
+        As long as a wall doesn't cut one of these edges, the goal stays reachable.
+
+        The witnesses are cached until a wall is placed or removed.
+
+        Parameters
+        ----------
+        pos : str
+            The starting position (e.g., 'e1').
+        goal : str
+            The row number of the goal.
+
+        Returns
+        -------
+        set of tuple of str
+            The path's edges, in both directions. Empty if the goal is unreachable.
+        """
+        witness = self._path_witnesses.get((pos, goal))
+        if witness is None:
+            path = self.get_shortest_path(pos, goal)
+            witness = set(zip(path, path[1:])) | set(zip(path[1:], path))
+            self._path_witnesses[(pos, goal)] = witness
+        return witness
+
+    def wall_cuts_path(self, wall: str, pos: str, goal: str) -> bool:
+        """
+        Check if the given wall cuts the (cached) shortest path from the given
+        position to the goal. Only such walls can make the shortest path longer.
+
+        Parameters
+        ----------
+        wall : str
+            The wall to check.
+        pos : str
+            The starting position (e.g., 'e1').
+        goal : str
+            The row number of the goal.
 
-        return []  # No path found
+        Returns
+        -------
+        bool
+            True if the wall separates two consecutive cells of the path, False otherwise.
+        """
+        return not self._path_witness(pos, goal).isdisjoint(self._wall_connections(wall))
 
     def _is_reachable(self, board, player_pos, player_goal) -> bool:
         """
@@ -531,17 +838,108 @@ class Quoridor:
             A string representing the new position of the player's pawn on the board.
         """
         self.current_player.position_history.append(self.current_player.pos)
+        self._hash_pawn_move(self.current_player, self.current_player.pos, move)
         self.current_player.pos = move
 
+    @property
+    def version(self) -> int:
+        """
+        Version of the position, a new one is given by every move and the previous one
+        is restored by undoing it.
+        """
+        return self._versions[-1]
+
+    def _push_version(self) -> None:
+        self._version_counter += 1
+        self._versions.append(self._version_counter)
+
+    def _cached_legal_moves(self) -> list:
+        """
+        The cache entry of the current position, the least recently used entry is dropped when the cache is full.
+        The side to move is part of the key, since it can be switched without a move.
+        """
+        key = (self._versions[-1], self.current_player is self.player1)
+        entry = self._legal_moves_cache.get(key)
+        if entry is None:
+            entry = [None, None, None]
+            self._legal_moves_cache[key] = entry
+            if len(self._legal_moves_cache) > LEGAL_MOVES_CACHE_SIZE:
+                self._legal_moves_cache.popitem(last=False)
+        else:
+            self._legal_moves_cache.move_to_end(key)
+        return entry
+
     def get_legal_pawn_moves(self) -> Set[str]:
         """
         Get the legal moves for the current player's pawn.
+        They are generated once per position and version, see `version`.
 
         Returns
         -------
         set of str
             The set of legal moves for the current player's pawn.
         """
+        entry = self._cached_legal_moves()
+        if entry[0] is None:
+            entry[0] = self._generate_legal_pawn_moves()
+        return set(entry[0])
+
+    def get_legal_wall_moves(self) -> List[str]:
+        """
+        Get the legal wall moves for the current player.
+        They are generated once per position and version, see `version`.
+
+        Returns
+        -------
+        list of str
+            The list of legal wall moves for the current player.
+        """
+        entry = self._cached_legal_moves()
+        if entry[1] is None:
+            entry[1] = self._generate_legal_wall_moves()
+        return list(entry[1])
+
+    def filter_legal_walls(self, walls: List[str]) -> List[str]:
+        """
+        Get the legal walls out of the given walls for the current player, in their order.
+        The cached legal wall moves are used when they were generated, otherwise only the given walls
+        are validated and the results are cached with the position, see `version`.
+
+        Parameters
+        ----------
+        walls : list of str
+            The walls to check.
+
+        Returns
+        -------
+        list of str
+            The legal walls out of the given ones.
+        """
+        entry = self._cached_legal_moves()
+        if entry[1] is not None:
+            legal_walls = set(entry[1])
+            return [wall for wall in walls if wall in legal_walls]
+        checked_walls = entry[2]
+        if checked_walls is None:
+            checked_walls = entry[2] = {}
+        legal_walls = []
+        for wall in walls:
+            is_legal = checked_walls.get(wall)
+            if is_legal is None:
+                try:
+                    self.validate_move(wall)
+                    is_legal = True
+                except (IllegalWallPlacementError, NoWallToPlaceError):
+                    is_legal = False
+                checked_walls[wall] = is_legal
+            if is_legal:
+                legal_walls.append(wall)
+        return legal_walls
+
+    def _generate_legal_pawn_moves(self) -> Set[str]:
+        """
+        Generate the legal moves for the current player's pawn.
+        """
 
         # make a temporary copy of the list
         legal_pawn_moves = set(self.board[self.current_player.pos])
@@ -584,14 +982,9 @@ class Quoridor:
 
         return legal_pawn_moves
 
-    def get_legal_wall_moves(self) -> List[str]:
+    def _generate_legal_wall_moves(self) -> List[str]:
         """
-        Get the legal wall moves for the current player.
-
-        Returns
-        -------
-        list of str
-            The list of legal wall moves for the current player.
+        Generate the legal wall moves for the current player.
         """
         legal_walls = []
         if self.current_player.walls == 0:
@@ -679,30 +1072,57 @@ class Quoridor:
         wall : str
             The wall to remove the connections for.
         """
-        # remove connections
+        for cell_pair in self._wall_connections(wall):
+            # remove cell connections
+            board[cell_pair[1]].discard(cell_pair[0])
+            board[cell_pair[0]].discard(cell_pair[1])
+
+    def _restore_connections(self, board: Dict[str, set[str]], wall: str):
+        """
+        Restore the connections between the cells affected by the given wall.
+
+        Parameters
+        ----------
+        board : dict of {str: list of str}
+            The board to restore the connections on.
+        wall : str
+            The wall to restore the connections for.
+        """
+        for cell_pair in self._wall_connections(wall):
+            board[cell_pair[1]].add(cell_pair[0])
+            board[cell_pair[0]].add(cell_pair[1])
+
+    @staticmethod
+    def _wall_connections(wall: str) -> List[tuple]:
+        """
+        Get the pairs of adjacent cells that are separated by the given wall.
+
+        Parameters
+        ----------
+        wall : str
+            The wall to get the cell pairs for.
+
+        Returns
+        -------
+        list of tuple of str
+            The two pairs of cells the wall separates.
+        """
         cell = wall[:2]
         if wall[2] == "h":
-            connected_cells = [
+            return [
                 (cell, cell[0] + chr(ord(cell[1]) + 1)),
                 (
                     chr(ord(cell[0]) + 1) + cell[1],
                     chr(ord(cell[0]) + 1) + chr(ord(cell[1]) + 1),
                 ),
             ]
-        else:
-            connected_cells = [
-                (cell, chr(ord(cell[0]) + 1) + cell[1]),
-                (
-                    cell[0] + chr(ord(cell[1]) + 1),
-                    chr(ord(cell[0]) + 1) + chr(ord(cell[1]) + 1),
-                ),
-            ]
-        for cell_pair in connected_cells:
-            # remove cell connections
-            if cell_pair[0] in board[cell_pair[1]]:
-                board[cell_pair[1]].remove(cell_pair[0])
-            if cell_pair[1] in self.board[cell_pair[0]]:
-                board[cell_pair[0]].remove(cell_pair[1])
+        return [
+            (cell, chr(ord(cell[0]) + 1) + cell[1]),
+            (
+                cell[0] + chr(ord(cell[1]) + 1),
+                chr(ord(cell[0]) + 1) + chr(ord(cell[1]) + 1),
+            ),
+        ]
 
     def _make_wall_move(self, board: Dict[str, List[str]], wall: str):
         """
@@ -718,5 +1138,7 @@ class Quoridor:
         self.placed_walls.append(wall)
         self.current_player.placed_walls.append(wall)
         self.current_player.walls -= 1
+        self._hash_wall_move(self.current_player, wall, self.current_player.walls + 1)
 
         self._remove_connections(board, wall)
+        self._clear_wall_caches()
@@ -0,0 +1,212 @@
+"""
+# Monte Carlo Tree Search
+UCT player for the large branching factor of Quoridor.
+
+Pawn moves are always expanded, the walls are added to a node gradually
+(progressive widening): a node visited n times has at most
+`widening * n ** widening_exponent` wall children, the walls that cut the
+opponent's shortest path first. The leaves are valued by random rollouts
+(the rollout engine) or by an evaluation function from `Heuristics.py`.
+"""
+import math
+import random
+import time
+from typing import List, Optional
+
+from Constants import START_WALLS, GameStatus
+from Players import Player, filter_wall_candidates
+from exceptions import IllegalWallPlacementError, NoWallToPlaceError
+from rollout import Rollout
+
+
+class MCTSNode:
+    """
+    Represents a searched position, reached by `move`.
+    `wins` is counted for the player that made the move.
+    The moves that weren't expanded yet are kept in `untried`, walls are validated only when expanded.
+    """
+
+    __slots__ = ("move", "children", "visits", "wins", "untried")
+
+    def __init__(self, move: Optional[str] = None):
+        self.move = move
+        self.children: List["MCTSNode"] = []
+        self.visits = 0
+        self.wins = 0.0
+        self.untried: Optional[List[str]] = None
+
+    def wall_children(self) -> int:
+        # the pawn moves are expanded first, so they are at the start of the children
+        for index, child in enumerate(self.children):
+            if len(child.move) == 3:
+                return len(self.children) - index
+        return 0
+
+    def subtree_size(self) -> int:
+        size = 0
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            size += 1
+            nodes.extend(node.children)
+        return size
+
+
+class MCTSPlayer(Player):
+    """
+    Monte Carlo tree search player (UCT) with progressive widening over the walls.
+
+    Every move searches until `iterations` iterations are done or `move_time_budget` seconds passed,
+    whichever comes first, and plays the most visited move. The subtree of the position reached after the
+    player's move and the opponent's reply is kept for the next move. The tree grows up to `max_nodes`
+    nodes, after that the search only refines the statistics of the existing nodes.
+
+    Leaves are valued by `rollouts` random games of the rollout engine, or when `evaluation_function` is given,
+    by the evaluation of the leaf for the player to move. With `evaluation_scale` the evaluation is mapped to
+    a win probability by a logistic function, otherwise it has to be the win probability of the player to move
+    when that player moves first (`statistic_simulation_random_player` starts its games with the waiting player,
+    so it doesn't fit).
+    """
+    def __init__(self, id, pos, goal, walls=START_WALLS, position_history=None, placed_walls=None,
+                 evaluation_function=None, evaluation_scale=None, rollouts=1, iterations=1000,
+                 move_time_budget=None, exploration=math.sqrt(2), widening=1.0, widening_exponent=0.5,
+                 max_nodes=2 ** 18):
+        super().__init__(id, pos, goal, walls, position_history, placed_walls)
+        self.position_history = []
+        self.placed_walls = []
+        self.evaluation_function = evaluation_function
+        self.evaluation_scale = evaluation_scale
+        self.rollouts = rollouts
+        self.iterations = iterations
+        self.move_time_budget = move_time_budget
+        self.exploration = exploration
+        self.widening = widening
+        self.widening_exponent = widening_exponent
+        self.max_nodes = max_nodes
+        self.root = None
+        self.root_moves = None
+        self.node_count = 0
+        self.searched_iterations = []
+
+    def get_action(self, game_state):
+        self.__advance_root(game_state)
+        deadline = time.perf_counter() + self.move_time_budget if self.move_time_budget is not None else None
+        iterations = 0
+        # at least one iteration, so the root has a child to play
+        while iterations == 0 or iterations < self.iterations and (deadline is None or time.perf_counter() < deadline):
+            self.__iterate(game_state)
+            iterations += 1
+        self.searched_iterations.append(iterations)
+
+        best = max(self.root.children, key=lambda child: child.visits)
+        # keep the chosen subtree, the opponent's reply is matched on the next move
+        self.root = best
+        self.root_moves = list(game_state.moves) + [best.move]
+        self.node_count = best.subtree_size()
+        return best.move
+
+    def __advance_root(self, game_state):
+        """
+        Moves the root to the current position if it is in the kept subtree, otherwise starts a new tree
+        """
+        node = None
+        if self.root is not None and game_state.moves[:len(self.root_moves)] == self.root_moves:
+            node = self.root
+            for move in game_state.moves[len(self.root_moves):]:
+                node = next((child for child in node.children if child.move == move), None)
+                if node is None:
+                    break
+        if node is None:
+            node = MCTSNode()
+            self.node_count = 1
+        elif node is not self.root:
+            self.node_count = node.subtree_size()
+        node.move = None
+        self.root = node
+        self.root_moves = list(game_state.moves)
+
+    def __iterate(self, game_state):
+        """
+        Selects a path down the tree, expands a node, values the leaf and updates the path
+        """
+        node = self.root
+        path = [node]
+        while game_state.status != GameStatus.COMPLETED:
+            if node.untried is None:
+                node.untried = self.__candidate_moves(game_state)
+            child = self.__expand(game_state, node)
+            if child is not None:
+                path.append(child)
+                break
+            if not node.children:
+                break
+            node = self.__select(node)
+            game_state.make_move(node.move)
+            path.append(node)
+
+        # the value for the player to move at the leaf
+        if game_state.status == GameStatus.COMPLETED:
+            value = 0.0  # the player that just moved won
+        else:
+            value = self.__evaluate(game_state)
+        for node in reversed(path):
+            node.visits += 1
+            node.wins += 1 - value
+            value = 1 - value
+        for _ in range(len(path) - 1):
+            game_state.undo_move()
+
+    def __expand(self, game_state, node) -> Optional[MCTSNode]:
+        """
+        Adds a child to the node if the widening allows it, the move of the child is made on the game
+        """
+        if self.node_count >= self.max_nodes:
+            return None
+        while node.untried:
+            move = node.untried[-1]
+            if len(move) == 3 and node.wall_children() >= self.widening * node.visits ** self.widening_exponent:
+                return None
+            node.untried.pop()
+            try:
+                game_state.make_move(move)
+            except (IllegalWallPlacementError, NoWallToPlaceError):
+                continue
+            child = MCTSNode(move)
+            node.children.append(child)
+            self.node_count += 1
+            return child
+        return None
+
+    def __select(self, node) -> MCTSNode:
+        log_visits = math.log(node.visits)
+        return max(
+            node.children,
+            key=lambda child: math.inf if child.visits == 0 else
+            child.wins / child.visits + self.exploration * math.sqrt(log_visits / child.visits),
+        )
+
+    @staticmethod
+    def __candidate_moves(game_state) -> List[str]:
+        """
+        The moves of a node in reverse order of expansion: the pawn moves, then the walls that cut the
+        opponent's shortest path, then the rest of the filtered walls
+        """
+        opponent = game_state.waiting_player
+        walls = filter_wall_candidates(game_state)
+        random.shuffle(walls)
+        walls.sort(key=lambda wall: game_state.wall_cuts_path(wall, opponent.pos, opponent.goal))
+        pawn_moves = sorted(game_state.get_legal_pawn_moves())
+        random.shuffle(pawn_moves)
+        return walls + pawn_moves
+
+    def __evaluate(self, game_state) -> float:
+        """
+        The probability of the player to move to win
+        """
+        if self.evaluation_function is None:
+            rollout = Rollout.from_game(game_state)
+            return sum(rollout.play() == 0 for _ in range(self.rollouts)) / self.rollouts
+        value = self.evaluation_function(game_state)
+        if self.evaluation_scale is None:
+            return value
+        return 1 / (1 + math.exp(-max(min(value / self.evaluation_scale, 50), -50)))
@@ -0,0 +1,108 @@
+"""
+Move ordering for the search players.
+
+Alpha beta prunes more when the best move is searched first, so the moves
+are sorted by how likely they are to cause a cutoff:
+1. the principal variation move (best move of a previous search of the position)
+2. killer moves, moves that caused a cutoff in a sibling node on the same ply
+3. pawn moves
+4. walls that cut the opponent's shortest path, since only they can lengthen it
+5. the rest of the walls
+Walls of the same group are ordered by the history heuristic, how often and
+how deep they caused cutoffs so far.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+
+class MoveOrdering:
+    """
+    Orders the moves of a search node.
+
+    Parameters
+    ----------
+    killers : int, optional
+        The number of killer moves kept per ply, by default 2. 0 disables killer moves.
+    history : bool, optional
+        Whether to order the walls by the history heuristic, by default True.
+    lengthen_opponent_path : bool, optional
+        Whether to prefer walls that cut the opponent's shortest path, by default True.
+    """
+
+    def __init__(self, killers: int = 2, history: bool = True, lengthen_opponent_path: bool = True):
+        self.killers = killers
+        self.history = history
+        self.lengthen_opponent_path = lengthen_opponent_path
+        self.killer_moves: Dict[int, List[str]] = defaultdict(list)
+        self.history_scores: Dict[str, int] = defaultdict(int)
+
+    def new_search(self) -> None:
+        """
+        Called before every search, the killers are reset and the history is aged
+        so that it follows the changes of the position.
+        """
+        self.killer_moves.clear()
+        for move in list(self.history_scores):
+            self.history_scores[move] //= 2
+            if self.history_scores[move] == 0:
+                del self.history_scores[move]
+
+    def order(self, game_state, moves: List[str], ply: int,
+              pv_moves: Sequence[Optional[str]] = ()) -> List[str]:
+        """
+        Sorts the moves of a node, best candidates first.
+
+        Parameters
+        ----------
+        game_state : Quoridor
+            The position of the node.
+        moves : list of str
+            The moves to order.
+        ply : int
+            The distance of the node from the root of the search.
+        pv_moves : sequence of str, optional
+            Moves known to be best in this position, most trusted first.
+
+        Returns
+        -------
+        list of str
+            The ordered moves.
+        """
+        pv_moves = [move for move in pv_moves if move is not None]
+        killers = self.killer_moves.get(ply, [])
+        opponent = game_state.waiting_player
+
+        def score(move):
+            if move in pv_moves:
+                return 4, -pv_moves.index(move)
+            if move in killers:
+                return 3, -killers.index(move)
+            if len(move) == 2:
+                return 2, 0
+            cuts_path = self.lengthen_opponent_path and \
+                game_state.wall_cuts_path(move, opponent.pos, opponent.goal)
+            return int(cuts_path), self.history_scores.get(move, 0) if self.history else 0
+
+        return sorted(moves, key=score, reverse=True)
+
+    def record_cutoff(self, move: str, ply: int, depth: int) -> None:
+        """
+        Records a move that caused a cutoff.
+
+        Parameters
+        ----------
+        move : str
+            The move that caused the cutoff.
+        ply : int
+            The distance of the node from the root of the search.
+        depth : int
+            The remaining depth of the node.
+        """
+        if self.killers:
+            killers = self.killer_moves[ply]
+            if move in killers:
+                killers.remove(move)
+            killers.insert(0, move)
+            del killers[self.killers:]
+        if self.history and len(move) == 3:
+            self.history_scores[move] += depth * depth
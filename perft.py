@@ -0,0 +1,215 @@
+"""
+Perft: counts the leaves of the game tree to a fixed depth, to check a move
+generator against the reference rules (jumps, side-steps, wall overlap and
+reachability) and to measure its throughput.
+
+    python perft.py --depth 2 --pgn e2/e8 --divide
+    python perft.py --differential --games 100
+
+The differential mode plays random games on two engines side by side and
+reports the first position where they disagree.
+A finished game is a leaf, it is counted once even if it ends before the depth.
+"""
+import argparse
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2, GameStatus
+from Players import Player
+from game_bitboard import BitboardQuoridor
+from game_faster import Quoridor
+
+ENGINES: Dict[str, type] = {"dict": Quoridor, "bitboard": BitboardQuoridor}
+
+
+@dataclass
+class Difference:
+    """
+    Represents the first disagreement of two engines.
+
+    Attributes
+    ----------
+    pgn : str
+        The moves that lead to the position.
+    check : str
+        What was compared, e.g. "legal wall moves".
+    first : object
+        The result of the first engine.
+    second : object
+        The result of the second engine.
+    """
+
+    pgn: str
+    check: str
+    first: object
+    second: object
+
+
+def _position(engine: type, pgn: str = "") -> Quoridor:
+    game_state = engine(Player(1, START_POS_P1, GOAL_P1), Player(2, START_POS_P2, GOAL_P2))
+    for move in filter(None, pgn.split("/")):
+        game_state.make_move(move)
+    return game_state
+
+
+def perft(game_state: Quoridor, depth: int) -> int:
+    """
+    Counts the leaves of the game tree of the given depth.
+    The leaves under the last level are counted from the number of legal moves, without making them.
+
+    Parameters
+    ----------
+    game_state : Quoridor
+        The root position, it is restored when the count returns.
+    depth : int
+        The depth of the tree in plies.
+
+    Returns
+    -------
+    int
+        The number of leaves.
+    """
+    if depth == 0 or game_state.status == GameStatus.COMPLETED:
+        return 1
+    moves = game_state.get_legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        game_state.make_move(move)
+        nodes += perft(game_state, depth - 1)
+        game_state.undo_move()
+    return nodes
+
+
+def divide(game_state: Quoridor, depth: int) -> Dict[str, int]:
+    """
+    Counts the leaves under every root move, the sum is `perft(game_state, depth)`.
+
+    Returns
+    -------
+    dict of str to int
+        Root move -> number of leaves of its subtree (of depth - 1), sorted by move.
+    """
+    counts = {}
+    for move in sorted(game_state.get_legal_moves()):
+        game_state.make_move(move)
+        counts[move] = perft(game_state, depth - 1)
+        game_state.undo_move()
+    return counts
+
+
+def _compare_positions(first: Quoridor, second: Quoridor) -> Optional[Difference]:
+    checks = [
+        ("status", lambda game_state: game_state.status),
+        ("legal pawn moves", lambda game_state: sorted(game_state.get_legal_pawn_moves())),
+        ("legal wall moves", lambda game_state: game_state.get_legal_wall_moves()),
+        ("shortest path lengths", lambda game_state: [
+            game_state.get_shortest_path_length(player.pos, player.goal)
+            for player in (game_state.current_player, game_state.waiting_player)
+        ]),
+        ("zobrist hash", lambda game_state: game_state.zobrist_hash),
+        ("state key", lambda game_state: game_state.get_state_key()),
+    ]
+    for check, result in checks:
+        first_result, second_result = result(first), result(second)
+        if first_result != second_result:
+            return Difference(first.get_pgn(), check, first_result, second_result)
+    return None
+
+
+def differential(first_engine: type, second_engine: type, games: int = 100, seed: int = 0,
+                 max_moves: int = 200, undo_probability: float = 0.1) -> Optional[Difference]:
+    """
+    Plays random games on two engines side by side and compares them in every position:
+    the legal moves, the shortest path lengths, the hashes and the status.
+
+    Parameters
+    ----------
+    first_engine, second_engine : type
+        The compared engines.
+    games : int, optional
+        The number of games, by default 100.
+    seed : int, optional
+        The seed of the random moves, by default 0.
+    max_moves : int, optional
+        The number of moves after which a game is stopped, by default 200.
+    undo_probability : float, optional
+        The probability of undoing a move after making it, by default 0.1.
+
+    Returns
+    -------
+    Difference or None
+        The first position where the engines disagree, None if they always agree.
+    """
+    rng = random.Random(seed)
+    for _ in range(games):
+        first, second = _position(first_engine), _position(second_engine)
+        while True:
+            difference = _compare_positions(first, second)
+            if difference is not None:
+                return difference
+            if first.status == GameStatus.COMPLETED or len(first.moves) >= max_moves:
+                break
+            pawn_moves = sorted(first.get_legal_pawn_moves())
+            walls = first.get_legal_wall_moves()
+            # pawn moves are most of the moves played, so the games get past the opening
+            move = rng.choice(pawn_moves if not walls or rng.random() < 0.6 else walls)
+            first.make_move(move)
+            second.make_move(move)
+            if rng.random() < undo_probability:
+                first.undo_move()
+                second.undo_move()
+                difference = _compare_positions(first, second)
+                if difference is not None:
+                    return difference
+                first.make_move(move)
+                second.make_move(move)
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Counts the game tree leaves or compares two engines")
+    parser.add_argument("--engine", choices=list(ENGINES), default="bitboard")
+    parser.add_argument("--pgn", action="append", help="root position, repeatable, by default the start position")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--divide", action="store_true", help="print the leaves under every root move")
+    parser.add_argument("--differential", action="store_true", help="compare two engines on random games")
+    parser.add_argument("--against", choices=list(ENGINES), default="dict", help="the engine compared with --engine")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.differential:
+        start = time.perf_counter()
+        difference = differential(ENGINES[args.engine], ENGINES[args.against], args.games, args.seed)
+        if difference is not None:
+            print(f"{difference.check} differ at {difference.pgn or 'the start position'}:")
+            print(f"  {args.engine}: {difference.first}")
+            print(f"  {args.against}: {difference.second}")
+            return 1
+        print(f"{args.engine} and {args.against} agree on {args.games} games "
+              f"({time.perf_counter() - start:.1f}s)")
+        return 0
+
+    for pgn in args.pgn or [""]:
+        game_state = _position(ENGINES[args.engine], pgn)
+        start = time.perf_counter()
+        if args.divide:
+            counts = divide(game_state, args.depth)
+            for move, count in counts.items():
+                print(f"{move}: {count}")
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(game_state, args.depth)
+        elapsed = time.perf_counter() - start
+        print(f"{pgn or 'start'} depth {args.depth}: {nodes} nodes in {elapsed:.2f}s "
+              f"({nodes / elapsed:,.0f} nodes/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
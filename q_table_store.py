@@ -0,0 +1,227 @@
+"""
+Memory-mapped Q-table store.
+
+The table is a file holding an open addressing hash table (linear probing)
+of (state key, action) -> Q value entries, see `Quoridor.get_state_key`.
+The file is mapped read-only, so lookups read straight from the page cache
+without loading the table, and processes that open the same file share its pages.
+
+A store is immutable: appending or merging training results writes a new file
+next to the old one and atomically replaces it. Readers that already mapped the
+old file keep reading it until they reopen the store. The merge works on the
+entry arrays (NumPy), the stored entries are never converted to Python objects.
+"""
+import os
+import struct
+from typing import Iterator, Mapping, Optional, Tuple
+
+import numpy as np
+
+from Constants import POSSIBLE_WALLS
+
+MAGIC = b"QTBL"
+VERSION = 2
+# magic, version, capacity, number of entries
+HEADER = struct.Struct("<4sIQQ")
+HEADER_SIZE = 32
+# The (state key, action) pair is packed into 3 words, the top bit marks a used slot
+ENTRY_DTYPE = np.dtype([("lo", "<u8"), ("mid", "<u8"), ("hi", "<u8"), ("value", "<f8")])
+WORD_MASK = (1 << 64) - 1
+USED = 1 << 63
+MAX_LOAD = 0.5
+
+# action -> code, the pawn moves are the cells and the walls follow them
+ACTIONS = [column + str(row) for row in range(1, 10) for column in "abcdefghi"] + POSSIBLE_WALLS
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+StateAction = Tuple[int, str]
+
+
+def pack_key(state_action: StateAction) -> Tuple[int, int, int]:
+    """
+    Packs a (state key, action) pair into the 3 words of an entry.
+    """
+    state_key, action = state_action
+    key = state_key << 8 | ACTION_CODES[action]
+    return key & WORD_MASK, key >> 64 & WORD_MASK, key >> 128 | USED
+
+
+def unpack_key(lo: int, mid: int, hi: int) -> StateAction:
+    """
+    Unpacks the words of an entry into its (state key, action) pair.
+    """
+    key = (hi & ~USED) << 128 | mid << 64 | lo
+    return key >> 8, ACTIONS[key & 0xFF]
+
+
+HASH_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F)
+
+
+def _slot(lo: int, mid: int, hi: int, capacity: int) -> int:
+    """
+    The first slot of an entry, the capacity is a power of 2. Same as `_slots` for a single entry.
+    """
+    return ((lo * HASH_MULTIPLIERS[0] & WORD_MASK) ^ (mid * HASH_MULTIPLIERS[1] & WORD_MASK) ^ hi) & (capacity - 1)
+
+
+def _slots(lo: np.ndarray, mid: np.ndarray, hi: np.ndarray, capacity: int) -> np.ndarray:
+    # uint64 products wrap around, like the masked products of _slot
+    return ((lo * np.uint64(HASH_MULTIPLIERS[0])) ^ (mid * np.uint64(HASH_MULTIPLIERS[1])) ^ hi) \
+        & np.uint64(capacity - 1)
+
+
+def _table_arrays(table) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The (lo, mid, hi, value) arrays of a table's entries, read straight from the file for a store
+    """
+    if isinstance(table, QTableStore):
+        used = (table._hi & np.uint64(USED)) != 0
+        return table._lo[used], table._mid[used], table._hi[used], table._values[used]
+    words = np.array([pack_key(state_action) for state_action in table.keys()], dtype=np.uint64).reshape(-1, 3)
+    values = np.fromiter(table.values(), dtype=np.float64, count=len(words))
+    return words[:, 0], words[:, 1], words[:, 2], values
+
+
+class QTableStore(Mapping):
+    """
+    Read-only view of a Q-table file, behaves like a dict of (state key, action) -> Q value.
+
+    Parameters
+    ----------
+    path : str
+        The path of the table file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            magic, version, capacity, count = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a Q-table file of version {VERSION}")
+        self.capacity = capacity
+        self.count = count
+        self.entries = np.memmap(path, dtype=ENTRY_DTYPE, mode="r", offset=HEADER_SIZE, shape=(capacity,))
+        self._lo = self.entries["lo"]
+        self._mid = self.entries["mid"]
+        self._hi = self.entries["hi"]
+        self._values = self.entries["value"]
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        """
+        Whether the given file is a Q-table file (and not e.g. a pickled table).
+        """
+        with open(path, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+
+    def _find(self, state_action: StateAction) -> Optional[int]:
+        lo, mid, hi = pack_key(state_action)
+        index = _slot(lo, mid, hi, self.capacity)
+        while True:
+            entry_hi = int(self._hi[index])
+            if not entry_hi & USED:
+                return None
+            if entry_hi == hi and int(self._lo[index]) == lo and int(self._mid[index]) == mid:
+                return index
+            index = (index + 1) & (self.capacity - 1)
+
+    def __getitem__(self, state_action: StateAction) -> float:
+        index = self._find(state_action)
+        if index is None:
+            raise KeyError(state_action)
+        return float(self._values[index])
+
+    def __contains__(self, state_action) -> bool:
+        return self._find(state_action) is not None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[StateAction]:
+        for index in np.nonzero(self._hi & np.uint64(USED))[0]:
+            yield unpack_key(int(self._lo[index]), int(self._mid[index]), int(self._hi[index]))
+
+    def items(self) -> Iterator[Tuple[StateAction, float]]:
+        for index in np.nonzero(self._hi & np.uint64(USED))[0]:
+            state_action = unpack_key(int(self._lo[index]), int(self._mid[index]), int(self._hi[index]))
+            yield state_action, float(self._values[index])
+
+    @classmethod
+    def write(cls, path: str, *tables: Mapping[StateAction, float]) -> "QTableStore":
+        """
+        Writes the entries of the given tables (dicts or stores) to a new table file,
+        replacing the file at the path atomically. When tables share a pair, the later table's value is kept.
+
+        Parameters
+        ----------
+        path : str
+            The path of the table file.
+        *tables : mapping of (int, str) to float
+            The tables to write.
+
+        Returns
+        -------
+        QTableStore
+            The written store.
+        """
+        arrays = [_table_arrays(table) for table in tables]
+        lo, mid, hi, values = (np.concatenate([table[field] for table in arrays]) if arrays
+                               else np.zeros(0, dtype=np.uint64 if field < 3 else np.float64)
+                               for field in range(4))
+        # keep the last occurrence of every key: the first one of the reversed entries
+        keys = np.ascontiguousarray(np.stack([lo, mid, hi], axis=1)[::-1]).view(np.dtype((np.void, 24))).ravel()
+        _, first = np.unique(keys, return_index=True)
+        kept = len(lo) - 1 - first
+        lo, mid, hi, values = lo[kept], mid[kept], hi[kept], values[kept]
+
+        capacity = 1
+        while capacity * MAX_LOAD < max(len(lo), 1):
+            capacity *= 2
+        entries = np.zeros(capacity, dtype=ENTRY_DTYPE)
+        # linear probing, a round places every pending entry whose slot is free (the first one when several
+        # entries want the same slot), the others move to their next slot
+        pending = np.arange(len(lo))
+        slots = _slots(lo, mid, hi, capacity).astype(np.int64)
+        used = np.zeros(capacity, dtype=bool)
+        while len(pending):
+            free = ~used[slots]
+            candidates, candidate_slots = pending[free], slots[free]
+            _, first = np.unique(candidate_slots, return_index=True)
+            placed, placed_slots = candidates[first], candidate_slots[first]
+            used[placed_slots] = True
+            entries["lo"][placed_slots] = lo[placed]
+            entries["mid"][placed_slots] = mid[placed]
+            entries["hi"][placed_slots] = hi[placed]
+            entries["value"][placed_slots] = values[placed]
+            is_pending = np.ones(len(pending), dtype=bool)
+            is_pending[np.flatnonzero(free)[first]] = False
+            pending, slots = pending[is_pending], (slots[is_pending] + 1) & (capacity - 1)
+
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, capacity, len(lo)).ljust(HEADER_SIZE, b"\0"))
+            file.write(entries.tobytes())
+        os.replace(temporary_path, path)
+        return cls(path)
+
+    @classmethod
+    def merge(cls, path: str, *tables: Mapping[StateAction, float]) -> "QTableStore":
+        """
+        Adds the entries of the given tables to the table file at the path (which is created if missing),
+        the values of the given tables replace the stored ones.
+
+        Parameters
+        ----------
+        path : str
+            The path of the table file.
+        *tables : mapping of (int, str) to float
+            The tables to add, e.g. the q values of a training run.
+
+        Returns
+        -------
+        QTableStore
+            The updated store.
+        """
+        if os.path.exists(path):
+            return cls.write(path, cls(path), *tables)
+        return cls.write(path, *tables)
@@ -6,13 +6,21 @@ beforehand about the option to use a defaultdict in order to implement
 default values of 0 for a dictionary that represents the q values
 indexed by state-action pairs as specified in the Q learning algorithm.
 """
+import ast
 from collections import defaultdict
 import pickle
-from typing import overload
+from typing import Dict, Tuple, overload
 import numpy as np
 from Constants import START_WALLS
-from game_faster import Quoridor
+from game_faster import STATE_KEY_WALLS_MASK, Quoridor
 from Players import Player
+from q_table_store import ACTIONS, QTableStore
+from replay_buffer import TransitionBatch, decode_state_keys
+
+# Old tables were keyed by str(game_state), which only holds the board's connections
+LEGACY_STATE_PREFIX = "board: "
+# action code -> action, for decoding arrays of codes
+ACTION_NAMES = np.array(ACTIONS, dtype=object)
 
 class QLearningPlayer(Player):
     def __init__(self, id, pos, goal, walls=START_WALLS,
@@ -24,8 +32,17 @@ class QLearningPlayer(Player):
         self.epsilon = epsilon
         self.discount = gamma
         self.num_training = num_training
-        # A dictionary that returns 0 on non existent keys
+        # A dictionary that returns 0 on non existent keys,
+        # indexed by (game_state.get_state_key(), action)
         self.q_values = defaultdict(float) 
+        # Values of an old table, indexed by (walls part of the state key, action), see migrate_q_values
+        self.legacy_q_values = {}
+        # Memory-mapped table loaded by import_q_values, for the pairs that weren't updated since
+        self.q_store = None
+        # Legal actions of the states visited in the current turn (the state and its successor), by state key
+        self.turn_legal_actions = {}
+        # Transitions recorded by update instead of learning them, when set to a list or a ReplayBuffer
+        self.transitions = None
         self.expects_update = True
         
     def stop_learning(self):
@@ -37,8 +54,38 @@ class QLearningPlayer(Player):
         Should return 0.0 if we never seen
         a state or (state,action) tuple
         """
-        state_action_pair = (str(game_state), action)
-        return self.q_values[state_action_pair]
+        return self.__q_value(game_state.get_state_key(), action)
+
+    def __q_value(self, state_key: int, action: str) -> float:
+        state_action_pair = (state_key, action)
+        if state_action_pair in self.q_values:
+            return self.q_values[state_action_pair]
+        if self.q_store is not None:
+            value = self.q_store.get(state_action_pair)
+            if value is not None:
+                return value
+        if self.legacy_q_values:
+            return self.legacy_q_values.get((state_key & STATE_KEY_WALLS_MASK, action), 0.0)
+        return 0.0
+
+    def __q_values(self, state_action_pairs) -> np.ndarray:
+        """
+        The q values of the pairs, read with a single dict lookup each when there is no other table
+        """
+        if self.q_store is None and not self.legacy_q_values:
+            get = self.q_values.get
+            return np.array([get(state_action, 0.0) for state_action in state_action_pairs], dtype=np.float64)
+        return np.array([self.__q_value(*state_action) for state_action in state_action_pairs], dtype=np.float64)
+
+    def __legal_actions(self, game_state: Quoridor, state_key: int):
+        """
+        The legal actions of the state, generated once per turn
+        """
+        legal_actions = self.turn_legal_actions.get(state_key)
+        if legal_actions is None:
+            legal_actions = game_state.get_legal_moves()
+            self.turn_legal_actions[state_key] = legal_actions
+        return legal_actions
 
     def get_policy(self, game_state: Quoridor) -> str:
         """
@@ -46,13 +93,14 @@ class QLearningPlayer(Player):
         are no legal actions, which is the case at the terminal state,
         you should return None.
         """
-        legal_actions = game_state.get_legal_moves()
+        state_key = game_state.get_state_key()
+        legal_actions = self.__legal_actions(game_state, state_key)
 
         best_action = legal_actions[0] 
         best_value = float('-inf')
 
         for action in legal_actions:
-            q_value = self.get_q_value(game_state, action)
+            q_value = self.__q_value(state_key, action)
             if q_value > best_value:
                 best_value = q_value
                 best_action = action
@@ -62,8 +110,10 @@ class QLearningPlayer(Player):
     def get_action(self, game_state: Quoridor) -> str:
         """
         Get the action to play on the board based on epsilon-greedy policy.
+        A new turn starts, the legal actions of the previous turn are dropped.
         """
-        legal_actions = game_state.get_legal_moves()
+        self.turn_legal_actions.clear()
+        legal_actions = self.__legal_actions(game_state, game_state.get_state_key())
 
         # With probability epsilon, choose a random action
         if np.random.rand() < self.epsilon:
@@ -79,10 +129,11 @@ class QLearningPlayer(Player):
         there are no legal actions, which is the case at the
         terminal state, you should return a value of 0.0.
         """
-        legal_actions = game_state.get_legal_moves()
+        state_key = game_state.get_state_key()
+        legal_actions = self.__legal_actions(game_state, state_key)
 
         return max(
-            self.get_q_value(game_state, action) for action in legal_actions
+            self.__q_value(state_key, action) for action in legal_actions
         )
 
     
@@ -91,21 +142,149 @@ class QLearningPlayer(Player):
         This function observes a state,action => next_state and reward transition.
         Since we can play the game by ourselves - we can just take state.make_move(action)
         and then do state.undo_move()
+        When the player acts for another learner (transitions is a list), the transition
+        is recorded instead of learned
         """
-        state_action_pair = (str(state), action)
+        state_key = state.get_state_key()
         state.make_move(action)
-        next_value = self.get_value(state)
+        next_state_key = state.get_state_key()
+        next_actions = self.__legal_actions(state, next_state_key)
         state.undo_move()
-        old_value = self.q_values[state_action_pair]
 
         # print(reward)
 
-        self.q_values[state_action_pair] = \
+        if self.transitions is not None:
+            self.transitions.append((state_key, action, reward, next_state_key, next_actions))
+            return
+        self.learn(state_key, action, reward, next_state_key, next_actions)
+
+    def learn(self, state_key: int, action: str, reward: float, next_state_key: int, next_actions):
+        """
+        Q learning update of a transition given by state keys, next_actions are the legal actions
+        of the next state
+        """
+        next_value = max(self.__q_value(next_state_key, next_action) for next_action in next_actions)
+        old_value = self.__q_value(state_key, action)
+        self.q_values[(state_key, action)] = \
             old_value + self.alpha * (reward + self.discount * next_value - old_value)
 
+    def learn_batch(self, batch: TransitionBatch):
+        """
+        Q learning update of a batch of replayed transitions, computed on the batch arrays.
+        The targets and the updates of the whole batch are computed from the table before the batch is applied,
+        when a (state, action) pair is sampled more than once its last update is kept
+        """
+        size = len(batch)
+        # every distinct state key is decoded once
+        unique_words, inverse = np.unique(np.concatenate([batch.state_keys, batch.next_state_keys]),
+                                          axis=0, return_inverse=True)
+        keys = decode_state_keys(unique_words)
+        inverse = inverse.reshape(-1)
+        state_keys, next_states = keys[inverse[:size]], inverse[size:]
+
+        # the q values of the legal actions of every distinct next state, reduced to their max
+        distinct_next, first = np.unique(next_states, return_index=True)
+        owners, codes = np.nonzero(batch.next_actions[first])
+        next_q_values = self.__q_values(zip(keys[distinct_next][owners].tolist(), ACTION_NAMES[codes].tolist()))
+        next_max = np.full(len(distinct_next), -np.inf)
+        np.maximum.at(next_max, owners, next_q_values)
+        next_values = next_max[np.searchsorted(distinct_next, next_states)]
+
+        state_actions = list(zip(state_keys.tolist(), ACTION_NAMES[batch.actions].tolist()))
+        old_values = self.__q_values(state_actions)
+        targets = batch.rewards + self.discount * next_values
+        self.q_values.update(zip(state_actions, (old_values + self.alpha * (targets - old_values)).tolist()))
+
     def import_q_values(self, file_path: str):
+        """
+        Loads a table written by export_q_values (memory-mapped, not read into memory)
+        or a pickled table
+        """
+        if QTableStore.is_store(file_path):
+            self.q_values = defaultdict(float)
+            self.legacy_q_values = {}
+            self.q_store = QTableStore(file_path)
+            return
         with open(file_path, "rb") as q_values:
-            self.q_values = pickle.load(q_values)
+            self.set_q_values(pickle.load(q_values))
+
+    def export_q_values(self, file_path: str):
+        """
+        Merges the q values into the table file (created if missing), the values
+        learned here replace the stored ones.
+        Values of an old table are keyed by the walls only, so they can't be stored with the state keys
+        and a player that uses them can't be exported (pickle the old table with the new values instead)
+        """
+        if self.legacy_q_values:
+            raise ValueError("Values migrated from an old table (keyed by str(game_state)) can't be exported "
+                             "to a Q-table file")
+        tables = [self.q_store] if self.q_store is not None and self.q_store.path != file_path else []
+        QTableStore.merge(file_path, *tables, self.q_values)
+
+    def set_q_values(self, q_values: dict):
+        """
+        Uses the given table, an old table (keyed by str(game_state)) is migrated
+        and used for the states that weren't updated since
+        """
+        self.q_store = None
+        if is_legacy_q_values(q_values):
+            self.q_values = defaultdict(float)
+            self.legacy_q_values = migrate_q_values(q_values)
+        else:
+            self.q_values = q_values if isinstance(q_values, defaultdict) else defaultdict(float, q_values)
+            self.legacy_q_values = {}
+
+
+def is_legacy_q_values(q_values: dict) -> bool:
+    """
+    Whether the table is keyed by str(game_state) instead of the state key
+    """
+    first_key = next(iter(q_values), None)
+    return first_key is not None and isinstance(first_key[0], str)
+
+
+def migrate_q_values(q_values: dict) -> Dict[Tuple[int, str], float]:
+    """
+    Converts a table keyed by (str(game_state), action) to the compact keys.
+    str(game_state) only holds the board's connections, so the old values are
+    keyed by the walls part of the state key (game_state.get_state_key() & STATE_KEY_WALLS_MASK),
+    which is what they were looked up by before.
+    """
+    walls_keys = {}
+    migrated = {}
+    for (state, action), value in q_values.items():
+        if state not in walls_keys:
+            walls_keys[state] = legacy_walls_key(state)
+        migrated[(walls_keys[state], action)] = value
+    return migrated
+
+
+def legacy_walls_key(state: str) -> int:
+    """
+    Recovers the walls part of the state key from an old str(game_state) key.
+    Walls can't overlap, so every run of cut connections along a row (or column)
+    is split into walls from its start.
+    """
+    board = ast.literal_eval(state[len(LEGACY_STATE_PREFIX):])
+    columns = "abcdefghi"
+    h_walls = v_walls = 0
+    for row in range(1, 9):
+        col = 0
+        while col < 9:
+            if columns[col] + str(row + 1) not in board[columns[col] + str(row)]:
+                h_walls |= 1 << ((row - 1) * 8 + col)
+                col += 2
+            else:
+                col += 1
+    for col in range(8):
+        row = 1
+        while row < 10:
+            if columns[col + 1] + str(row) not in board[columns[col] + str(row)]:
+                v_walls |= 1 << ((row - 1) * 8 + col)
+                row += 2
+            else:
+                row += 1
+    return h_walls | v_walls << 64
 
 
 
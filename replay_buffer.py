@@ -0,0 +1,161 @@
+"""
+Experience replay for Q learning.
+
+Transitions are kept in preallocated NumPy arrays used as a ring buffer, once
+the buffer is full the oldest transitions are overwritten. A transition is
+stored in encoded form: the state keys (see `Quoridor.get_state_key`) as 3 words,
+the action code (see `q_table_store.ACTION_CODES`), the reward and the legal
+actions of the next state as a bitmask of action codes, so learning from it
+doesn't need live `Quoridor` objects.
+"""
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from q_table_store import ACTION_CODES, ACTIONS, WORD_MASK
+
+ACTION_MASK_BYTES = (len(ACTIONS) + 7) // 8
+
+# (state key, action, reward, next state key, legal actions of the next state)
+Transition = Tuple[int, str, float, int, Iterable[str]]
+
+
+def _key_words(key: int) -> Tuple[int, int, int]:
+    return key & WORD_MASK, key >> 64 & WORD_MASK, key >> 128
+
+
+def _words_key(words: np.ndarray) -> int:
+    return int(words[2]) << 128 | int(words[1]) << 64 | int(words[0])
+
+
+def decode_state_keys(words: np.ndarray) -> np.ndarray:
+    """
+    Decodes an array of state keys in words, shape (n, 3), to an object array of the int state keys.
+    """
+    words = words.astype(object)
+    return words[:, 2] << 128 | words[:, 1] << 64 | words[:, 0]
+
+
+@dataclass
+class TransitionBatch:
+    """
+    Represents sampled transitions, in encoded form.
+
+    Attributes
+    ----------
+    state_keys : np.ndarray
+        The state keys, shape (batch, 3), low word first.
+    actions : np.ndarray
+        The action codes.
+    rewards : np.ndarray
+        The rewards.
+    next_state_keys : np.ndarray
+        The next state keys, shape (batch, 3), low word first.
+    next_actions : np.ndarray
+        Whether each action is legal in the next state, shape (batch, number of actions).
+    """
+
+    state_keys: np.ndarray
+    actions: np.ndarray
+    rewards: np.ndarray
+    next_state_keys: np.ndarray
+    next_actions: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def transitions(self) -> List[Transition]:
+        """
+        Decodes the batch to (state key, action, reward, next state key, next actions) transitions.
+        """
+        return [
+            (
+                _words_key(self.state_keys[index]),
+                ACTIONS[self.actions[index]],
+                float(self.rewards[index]),
+                _words_key(self.next_state_keys[index]),
+                [ACTIONS[code] for code in np.flatnonzero(self.next_actions[index])],
+            )
+            for index in range(len(self))
+        ]
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of transitions.
+    It can be set as `QLearningPlayer.transitions`, so the player's transitions are stored instead of learned.
+
+    Parameters
+    ----------
+    capacity : int
+        The maximal number of transitions kept.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("Replay buffer capacity must be positive")
+        self.capacity = capacity
+        self.state_keys = np.zeros((capacity, 3), dtype=np.uint64)
+        self.actions = np.zeros(capacity, dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_state_keys = np.zeros((capacity, 3), dtype=np.uint64)
+        self.next_actions = np.zeros((capacity, ACTION_MASK_BYTES), dtype=np.uint8)
+        self.position = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, transition: Transition) -> None:
+        """
+        Stores a transition, overwriting the oldest one when the buffer is full.
+
+        Parameters
+        ----------
+        transition : tuple
+            (state key, action, reward, next state key, legal actions of the next state).
+        """
+        state_key, action, reward, next_state_key, next_actions = transition
+        index = self.position
+        self.state_keys[index] = _key_words(state_key)
+        self.actions[index] = ACTION_CODES[action]
+        self.rewards[index] = reward
+        self.next_state_keys[index] = _key_words(next_state_key)
+        legal = np.zeros(len(ACTIONS), dtype=bool)
+        legal[[ACTION_CODES[next_action] for next_action in next_actions]] = True
+        self.next_actions[index] = np.packbits(legal)
+        self.position = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, transitions: Iterable[Transition]) -> None:
+        for transition in transitions:
+            self.append(transition)
+
+    def sample(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> TransitionBatch:
+        """
+        Samples transitions uniformly, with replacement.
+
+        Parameters
+        ----------
+        batch_size : int
+            The number of transitions to sample.
+        rng : np.random.Generator, optional
+            The random generator, by default `np.random`.
+
+        Returns
+        -------
+        TransitionBatch
+            The sampled transitions.
+        """
+        if self.size == 0:
+            raise ValueError("Cannot sample from an empty replay buffer")
+        indices = rng.integers(self.size, size=batch_size) if rng is not None \
+            else np.random.randint(self.size, size=batch_size)
+        return TransitionBatch(
+            state_keys=self.state_keys[indices],
+            actions=self.actions[indices],
+            rewards=self.rewards[indices],
+            next_state_keys=self.next_state_keys[indices],
+            next_actions=np.unpackbits(self.next_actions[indices], axis=1, count=len(ACTIONS)).astype(bool),
+        )
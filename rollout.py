@@ -0,0 +1,203 @@
+"""
+Lightweight rollout engine for Monte Carlo evaluation.
+
+A `Rollout` is a snapshot of a position in bitboard form (see `game_bitboard`).
+Playing it runs a random game on local copies of the snapshot, without the
+move validation, history and bookkeeping of `Quoridor`, and returns only the winner.
+The moves follow the policy of `RandomPlayer`: half of the turns a random pawn
+move, otherwise a random move out of the pawn moves and the legal walls near
+the pawns or the placed walls (the moves of `Players.filter_moves`).
+"""
+import random
+from typing import List, Optional
+
+from board_index import (
+    CELL_INDEX,
+    GOAL_MASKS,
+    NEAR_CELL_SLOTS,
+    NEAR_WALL_SLOTS,
+    OPEN_DOWN,
+    OPEN_LEFT,
+    OPEN_RIGHT,
+    OPEN_UP,
+    SLOT_WALLS,
+    WALL_TABLE,
+)
+from game_bitboard import (
+    descend_path,
+    flood_layers,
+    flood_reaches,
+    path_edge_masks,
+    pawn_destinations,
+)
+
+
+class Rollout:
+    """
+    Snapshot of a position for random playouts.
+    Seat 0 is the player to move in the snapshotted game and seat 1 is the waiting player.
+
+    Parameters
+    ----------
+    cells : list of int
+        The cells of the two pawns.
+    goals : list of int
+        The masks of the goal rows of the two players.
+    walls_left : list of int
+        The number of walls each player can still place.
+    placed_walls : list of str
+        The walls on the board.
+    """
+
+    __slots__ = ("cells", "goals", "walls_left", "h_walls", "v_walls", "open_edges", "near_walls")
+
+    def __init__(self, cells: List[int], goals: List[int], walls_left: List[int], placed_walls: List[str]):
+        self.cells = tuple(cells)
+        self.goals = tuple(goals)
+        self.walls_left = tuple(walls_left)
+        h_walls = v_walls = near_walls = 0
+        up, down, right, left = OPEN_UP, OPEN_DOWN, OPEN_RIGHT, OPEN_LEFT
+        for wall in placed_walls:
+            is_horizontal, bit, (cut_up, cut_down, cut_right, cut_left), _ = WALL_TABLE[wall]
+            if is_horizontal:
+                h_walls |= bit
+            else:
+                v_walls |= bit
+            up, down, right, left = up & ~cut_up, down & ~cut_down, right & ~cut_right, left & ~cut_left
+            near_walls |= NEAR_WALL_SLOTS[bit.bit_length() - 1]
+        self.h_walls = h_walls
+        self.v_walls = v_walls
+        self.open_edges = (up, down, right, left)
+        self.near_walls = near_walls
+
+    @classmethod
+    def from_game(cls, game_state) -> "Rollout":
+        """
+        Snapshots the position of the given game.
+
+        Parameters
+        ----------
+        game_state : Quoridor
+            The game to snapshot, any engine.
+
+        Returns
+        -------
+        Rollout
+            The snapshot, seat 0 is the game's current player.
+        """
+        players = (game_state.current_player, game_state.waiting_player)
+        return cls(
+            [CELL_INDEX[player.pos] for player in players],
+            [GOAL_MASKS[player.goal] for player in players],
+            [player.walls for player in players],
+            game_state.placed_walls,
+        )
+
+    def play(self, first: int = 0, rng: random.Random = random) -> int:
+        """
+        Plays a random game from the snapshot, the snapshot itself isn't changed.
+
+        Parameters
+        ----------
+        first : int, optional
+            The seat that moves first, by default 0.
+        rng : random.Random, optional
+            The random generator, by default the `random` module.
+
+        Returns
+        -------
+        int
+            The seat of the winner.
+        """
+        cells = list(self.cells)
+        goals = self.goals
+        walls_left = list(self.walls_left)
+        h_walls, v_walls, near_walls = self.h_walls, self.v_walls, self.near_walls
+        up, down, right, left = self.open_edges
+        # distance layers of the goal rows, recomputed only after a wall is placed
+        layers: List[Optional[List[int]]] = [None, None]
+        side = first
+
+        while True:
+            current, waiting = cells[side], cells[1 - side]
+            pawn_moves = pawn_destinations(current, waiting, up, down, right, left)
+            if walls_left[side] == 0 or rng.random() < .5:
+                target = rng.choice(pawn_moves)
+            else:
+                for seat in (0, 1):
+                    if layers[seat] is None:
+                        layers[seat] = flood_layers(goals[seat], up, down, right, left)
+                walls = _legal_walls(
+                    NEAR_CELL_SLOTS[current] | NEAR_CELL_SLOTS[waiting] | near_walls,
+                    h_walls, v_walls, up, down, right, left,
+                    [1 << cell for cell in cells],
+                    goals,
+                    [path_edge_masks(descend_path(cells[seat], layers[seat], up, down, right, left))
+                     for seat in (0, 1)],
+                )
+                choice = rng.randrange(len(pawn_moves) + len(walls))
+                if choice >= len(pawn_moves):
+                    is_horizontal, bit, (cut_up, cut_down, cut_right, cut_left), _ = WALL_TABLE[walls[choice - len(pawn_moves)]]
+                    if is_horizontal:
+                        h_walls |= bit
+                    else:
+                        v_walls |= bit
+                    up, down, right, left = up & ~cut_up, down & ~cut_down, right & ~cut_right, left & ~cut_left
+                    near_walls |= NEAR_WALL_SLOTS[bit.bit_length() - 1]
+                    walls_left[side] -= 1
+                    layers = [None, None]
+                    side = 1 - side
+                    continue
+                target = pawn_moves[choice]
+
+            cells[side] = target
+            if goals[side] >> target & 1:
+                return side
+            side = 1 - side
+
+
+def _legal_walls(slots: int, h_walls: int, v_walls: int, up: int, down: int, right: int, left: int,
+                 starts: List[int], goals: List[int], witnesses: List[tuple]) -> List[str]:
+    """
+    Returns the legal walls on the given slots. The reachability of a player is
+    only searched when the wall cuts their shortest path (witness).
+    """
+    walls = []
+    while slots:
+        slot_bit = slots & -slots
+        slots ^= slot_bit
+        for wall in SLOT_WALLS[slot_bit.bit_length() - 1]:
+            _, _, (cut_up, cut_down, cut_right, cut_left), (h_conflicts, v_conflicts) = WALL_TABLE[wall]
+            if h_walls & h_conflicts or v_walls & v_conflicts:
+                continue
+            for start, goal, (path_up, path_right) in zip(starts, goals, witnesses):
+                if (path_up & cut_up or path_right & cut_right) and not flood_reaches(
+                        start, goal, up & ~cut_up, down & ~cut_down, right & ~cut_right, left & ~cut_left):
+                    break
+            else:
+                walls.append(wall)
+    return walls
+
+
+def simulate(game_state, num_to_simulate: int, first: int = 0, rng: random.Random = random) -> List[int]:
+    """
+    Plays random games from the given position.
+
+    Parameters
+    ----------
+    game_state : Quoridor
+        The position to play from.
+    num_to_simulate : int
+        The number of games to play.
+    first : int, optional
+        The seat that moves first, 0 for the game's current player and 1 for the waiting one, by default 0.
+    rng : random.Random, optional
+        The random generator, by default the `random` module.
+
+    Returns
+    -------
+    list of int
+        The seat of the winner of every game.
+    """
+    rollout = Rollout.from_game(game_state)
+    return [rollout.play(first, rng) for _ in range(num_to_simulate)]
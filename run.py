@@ -1,70 +1,61 @@
 import pickle
+from collections import defaultdict
 from numpy import average, number
 import tqdm
 import math
 import time
 from itertools import product
 
-from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2, START_WALLS
 from Heuristics import both_goals_evaluation_function, statistic_simulation_random_player,\
     walls_dist_heuristic, shortest_opponent_path, naive_self_dist_from_goal_evaluation_function, \
     shortest_self_dist_from_goal_evaluation_function, shortest_opponent_dist_from_goal_evaluation_function, \
     naive_opponent_dist_from_goal_evaluation_function, exp_shortest_opponent_dist_from_goal_evaluation_function, \
-    exp_shortest_self_dist_from_goal_evaluation_function, prevent_loop_function
+    exp_shortest_self_dist_from_goal_evaluation_function, prevent_loop_function, with_context
 from Players import RandomPlayer, HeuristicPlayer, AlphaBetaPlayer
 from game_faster import Quoridor
+from game_bitboard import BitboardQuoridor
+from mcts import MCTSPlayer
+from move_ordering import MoveOrdering
+from tournament import Match, Tournament
 import matplotlib.pyplot as plt
 import random
 import datetime
-from qlearning import QLearningPlayer
+from actor_learner import ActorLearnerTrainer
+from q_table_store import QTableStore
+from replay_buffer import ReplayBuffer
+from qlearning import QLearningPlayer, is_legacy_q_values, migrate_q_values
 
 def get_time_date() -> str:
     return datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
 
-def naive_vs_shortest():
-    for i in range(5):
-        random.seed(1)
-        alphabeta_1 = AlphaBetaPlayer(
-            id=1,
-            pos=START_POS_P1,
-            goal=GOAL_P1,
-            depth=1,
-            evaluation_function=lambda x: naive_self_dist_from_goal_evaluation_function(x) + (i+1)*naive_opponent_dist_from_goal_evaluation_function(x) - 100*prevent_loop_function(x),
-        )
-        alphabeta_2 = AlphaBetaPlayer(
-            id=2,
-            pos=START_POS_P2,
-            goal=GOAL_P2,
-            depth=1,
-            evaluation_function=lambda x: shortest_self_dist_from_goal_evaluation_function(x) + (i+1)*shortest_opponent_dist_from_goal_evaluation_function(x) - 100*prevent_loop_function(x),
+def alphabeta_factory(evaluation_function, depth=1, workers=1):
+    """
+    Factory of alpha beta players for the tournament runner, which closes the players after their game
+    """
+    return lambda id, pos, goal: AlphaBetaPlayer(
+        id=id,
+        pos=pos,
+        goal=goal,
+        depth=depth,
+        evaluation_function=evaluation_function,
+        workers=workers,
+    )
 
-        )
-        quoridor = Quoridor(alphabeta_1, alphabeta_2)
-        result = quoridor.play_game()
-        print('winner')
 
-    for i in range(5):
-        random.seed(1)
-        alphabeta_2 = AlphaBetaPlayer(
-            id=2,
-            pos=START_POS_P2,
-            goal=GOAL_P2,
-            depth=1,
-            evaluation_function=lambda x: naive_self_dist_from_goal_evaluation_function(
-                x) + 2 * naive_opponent_dist_from_goal_evaluation_function(x) - 100 * prevent_loop_function(x),
-        )
-        alphabeta_1 = AlphaBetaPlayer(
-            id=1,
-            pos=START_POS_P1,
-            goal=GOAL_P1,
-            depth=1,
-            evaluation_function=lambda x: shortest_self_dist_from_goal_evaluation_function(
-                x) + 2 * shortest_opponent_dist_from_goal_evaluation_function(x) - 100 * prevent_loop_function(x),
+def naive_vs_shortest(workers=None):
+    factories = {}
+    for factor in range(1, 6):
+        factories[f'naive-{factor}'] = alphabeta_factory(
+            with_context(lambda x, factor=factor: naive_self_dist_from_goal_evaluation_function(x) + factor*naive_opponent_dist_from_goal_evaluation_function(x) - 100*prevent_loop_function(x)))
+        factories[f'shortest-{factor}'] = alphabeta_factory(
+            with_context(lambda x, factor=factor: shortest_self_dist_from_goal_evaluation_function(x) + factor*shortest_opponent_dist_from_goal_evaluation_function(x) - 100*prevent_loop_function(x)))
+    schedule = [Match(f'naive-{factor}', f'shortest-{factor}', seed=1) for factor in range(1, 6)]
+    schedule += [Match('shortest-2', 'naive-2', seed=1) for _ in range(5)]
 
-        )
-        quoridor = Quoridor(alphabeta_1, alphabeta_2)
-        result = quoridor.play_game()
-        print('winner')
+    tournament = Tournament(factories, workers=workers)
+    for match, result in tournament.run(schedule):
+        print(f'winner: {match.player1 if result.winner.id == 1 else match.player2}')
 
 
 def exp_vs_normal():
@@ -74,14 +65,14 @@ def exp_vs_normal():
             pos=START_POS_P2,
             goal=GOAL_P2,
             depth=1,
-            evaluation_function=lambda x:  shortest_self_dist_from_goal_evaluation_function(x) + (shortest_opponent_dist_from_goal_evaluation_function(x))**2 - 100*prevent_loop_function(x),
+            evaluation_function=with_context(lambda x:  shortest_self_dist_from_goal_evaluation_function(x) + (shortest_opponent_dist_from_goal_evaluation_function(x))**2 - 100*prevent_loop_function(x)),
         )
         alphabeta_2 = AlphaBetaPlayer(
             id=1,
             pos=START_POS_P1,
             goal=GOAL_P1,
             depth=1,
-            evaluation_function=lambda x: exp_shortest_self_dist_from_goal_evaluation_function(x) + (exp_shortest_opponent_dist_from_goal_evaluation_function(x))**2- 100*prevent_loop_function(x),
+            evaluation_function=with_context(lambda x: exp_shortest_self_dist_from_goal_evaluation_function(x) + (exp_shortest_opponent_dist_from_goal_evaluation_function(x))**2- 100*prevent_loop_function(x)),
         )
         quoridor = Quoridor(alphabeta_1, alphabeta_2)
         result = quoridor.play_game()
@@ -94,17 +85,17 @@ def both_vs_self():
         pos=START_POS_P1,
         goal=GOAL_P1,
         depth=1,
-        evaluation_function=lambda x: shortest_self_dist_from_goal_evaluation_function(
-            x) + shortest_opponent_dist_from_goal_evaluation_function(x) - 100 * prevent_loop_function(x),
+        evaluation_function=with_context(lambda x: shortest_self_dist_from_goal_evaluation_function(
+            x) + shortest_opponent_dist_from_goal_evaluation_function(x) - 100 * prevent_loop_function(x)),
     )
     alphabeta_2 = AlphaBetaPlayer(
         id=2,
         pos=START_POS_P2,
         goal=GOAL_P2,
         depth=1,
-        evaluation_function=lambda x: shortest_self_dist_from_goal_evaluation_function(
+        evaluation_function=with_context(lambda x: shortest_self_dist_from_goal_evaluation_function(
             x) - 100 * prevent_loop_function(
-            x))
+            x)))
     quoridor = Quoridor(alphabeta_1, alphabeta_2)
     result = quoridor.play_game()
 
@@ -125,28 +116,21 @@ def heuristic_simulation_vs_self_dist():
     result = quoridor.play_game()
 
 
-def opponent_factor_evaluation():
-    num_of_turns = []
-    for i in range(20):
-        alphabeta = AlphaBetaPlayer(
-            id=1,
-            pos=START_POS_P1,
-            goal=GOAL_P1,
-            evaluation_function=lambda x: both_goals_evaluation_function(x, (i - 5) / 5),
-            depth=1
-        )
-        random = AlphaBetaPlayer(
-            id=2,
-            pos=START_POS_P2,
-            goal=GOAL_P2,
-            evaluation_function=lambda x: both_goals_evaluation_function(x, (i - 5) / 5),
-        )
-        quoridor = Quoridor(alphabeta, random)
-        result = quoridor.play_game()
-        print('winner')
-        print(result.total_moves)
-        num_of_turns.append(result.total_moves)
-    plt.plot([(i - 5) / 5 for i in range(20)], num_of_turns)
+def opponent_factor_evaluation(workers=None):
+    factors = [(i - 5) / 5 for i in range(20)]
+    factories = {
+        f'factor-{factor}': alphabeta_factory(lambda x, factor=factor: both_goals_evaluation_function(x, factor))
+        for factor in factors
+    }
+    schedule = [Match(f'factor-{factor}', f'factor-{factor}', seed=i) for i, factor in enumerate(factors)]
+
+    tournament = Tournament(factories, workers=workers)
+    turns_by_factor = {}
+    for match, result in tournament.run(schedule):
+        print(f'{match.player1}: {result.total_moves} turns')
+        turns_by_factor[match.player1] = result.total_moves
+    num_of_turns = [turns_by_factor[f'factor-{factor}'] for factor in factors]
+    plt.plot(factors, num_of_turns)
     plt.title("Game Length of different opponent factors")
     plt.xlabel("Opponent factor")
     plt.ylabel("Number of turns")
@@ -177,7 +161,11 @@ def random_vs_random():
     plt.show()
 
 def random_vs_learning(alpha=1, epsilon=0.3, gamma=0.8, number_of_matches: int = 100, 
-                       number_of_training_matches: int = 50):
+                       number_of_training_matches: int = 50, actors: int = None, sync_interval: int = 5):
+    """
+    Trains a q learner against a random player and plots its games after the training.
+    With `actors` the training matches are played by that many actor processes.
+    """
     num_of_turns = []
     q_learner = QLearningPlayer(
         id=1,
@@ -191,7 +179,13 @@ def random_vs_learning(alpha=1, epsilon=0.3, gamma=0.8, number_of_matches: int =
     q_counter = 0
     num_of_turns = []
     match_number = []
-    for i in range(number_of_matches):
+    first_match = 0
+    if actors:
+        trainer = ActorLearnerTrainer(q_learner, actors=actors, sync_interval=sync_interval)
+        trainer.train(number_of_training_matches)
+        print(f"trained at {trainer.games_per_second:.1f} games per second")
+        first_match = number_of_training_matches
+    for i in range(first_match, number_of_matches):
         if (i == number_of_training_matches):
             q_learner.epsilon = 0.05
             print(f"wins before stopped learning: {q_counter}")
@@ -243,41 +237,185 @@ def random_vs_learning(alpha=1, epsilon=0.3, gamma=0.8, number_of_matches: int =
 
 
     
-def learning_vs_alphabeta(q_values_path: str, depth: int, number_of_matches: int = 10):
+def learning_vs_alphabeta(q_values_path: str, depth: int, number_of_matches: int = 10, workers=None):
+    # a table file is memory-mapped once and shared by all the games, which are played one after the other in
+    # this process since the q learner keeps learning (see Tournament)
+    q_store = QTableStore(q_values_path) if QTableStore.is_store(q_values_path) else None
+    q_values, legacy_q_values = defaultdict(float), {}
+    if q_store is None:
+        with open(q_values_path, 'rb') as file:
+            q_values = pickle.load(file)
+        # old tables are migrated once and shared by all the games
+        legacy_q_values = migrate_q_values(q_values) if is_legacy_q_values(q_values) else {}
+        if legacy_q_values:
+            q_values = defaultdict(float)
+
+    def q_learner_factory(id, pos, goal):
+        q_learner = QLearningPlayer(
+            id=id,
+            pos=pos,
+            goal=goal,
+            epsilon=0.1
+        )
+        q_learner.q_values, q_learner.legacy_q_values = q_values, legacy_q_values
+        q_learner.q_store = q_store
+        return q_learner
+
+    factories = {'q_learner': q_learner_factory}
+    schedule = []
+    for i in range(number_of_matches):
+        factories[f'alphabeta-{i}'] = alphabeta_factory(
+            lambda x, i=i: both_goals_evaluation_function(x, (i - 5) / 5), depth=depth)
+        schedule.append(Match('q_learner', f'alphabeta-{i}', seed=i))
+
+    tournament = Tournament(factories, workers=workers, learning_players=['q_learner'])
+    results = list(tournament.run(schedule))
+    for match, result in results:
+        print(f"game {match.seed} ended")
+        print(f"player with id: {result.winner.id} won")
+    print(f"q_learner wins: {tournament.standings(results)['q_learner'].wins}")
+
+
+def move_ordering_node_counts(depth: int = 2):
+    """
+    Searches the same positions with and without move ordering and prints the number of searched nodes
+    """
+    positions = ['e2/e8/c3h/d6v/e3/f4h', 'e2/e8/e3/e7/d6h/f3h/c5v/f7', 'e2/e8/e3/e7/e4/e6h/d4h/c5v']
+    for pgn in positions:
+        node_counts = []
+        for move_ordering in (None, MoveOrdering()):
+            random.seed(1)
+            alphabeta = AlphaBetaPlayer(
+                id=1,
+                pos=START_POS_P1,
+                goal=GOAL_P1,
+                depth=depth,
+                evaluation_function=lambda x: both_goals_evaluation_function(x, -1),
+                move_ordering=move_ordering,
+            )
+            opponent = RandomPlayer(
+                id=2,
+                pos=START_POS_P2,
+                goal=GOAL_P2,
+            )
+            quoridor = BitboardQuoridor(alphabeta, opponent)
+            for move in pgn.split('/'):
+                quoridor.make_move(move)
+            alphabeta.get_action(quoridor)
+            node_counts.append(alphabeta.searched_nodes[-1])
+        print(f"{pgn}: {node_counts[0]} nodes before, {node_counts[1]} nodes after move ordering")
+
+
+def parallel_search_speedup(depth: int = 2, workers: int = 4):
+    """
+    Searches the same positions with a single process and with a pool of workers and prints the times
+    and the searched nodes
+    """
+    positions = ['e2/e8/c3h/d6v/e3/f4h', 'e2/e8/e3/e7/d6h/f3h/c5v/f7', 'e2/e8/e3/e7/e4/e6/d4/d6']
+    for pgn in positions:
+        results = []
+        for search_workers in (1, workers):
+            with AlphaBetaPlayer(
+                id=1,
+                pos=START_POS_P1,
+                goal=GOAL_P1,
+                depth=depth,
+                evaluation_function=lambda x: both_goals_evaluation_function(x, -1),
+                search_algorithm="negamax",
+                workers=search_workers,
+            ) as alphabeta:
+                quoridor = BitboardQuoridor(alphabeta, RandomPlayer(id=2, pos=START_POS_P2, goal=GOAL_P2))
+                for move in pgn.split('/'):
+                    quoridor.make_move(move)
+                start = time.perf_counter()
+                action = alphabeta.get_action(quoridor)
+                results.append((action, alphabeta.searched_nodes[-1], time.perf_counter() - start))
+        (serial_action, serial_nodes, serial_time), (action, nodes, elapsed) = results
+        print(f"{pgn}: 1 worker {serial_action} {serial_nodes} nodes {serial_time:.2f}s, "
+              f"{workers} workers {action} {nodes} nodes {elapsed:.2f}s ({serial_time / elapsed:.2f}x)")
+
+
+def q_learning_training_speed(number_of_games: int = 20, engine=BitboardQuoridor):
+    """
+    Trains a q learner against a random player and prints the training throughput
+    """
     q_learner = QLearningPlayer(
         id=1,
         pos=START_POS_P1,
         goal=GOAL_P1,
-        epsilon=0.1
     )
-
-    q_learner.import_q_values(q_values_path)
-
-    q_counter = 0
-    for i in tqdm.tqdm(range(number_of_matches)):
+    total_moves = 0
+    start = time.perf_counter()
+    for _ in range(number_of_games):
         q_learner.pos = START_POS_P1
-        q_learner.goal = GOAL_P1
-        random = AlphaBetaPlayer(
+        q_learner.walls = START_WALLS
+        q_learner.position_history = []
+        q_learner.placed_walls = []
+        random_player = RandomPlayer(
             id=2,
             pos=START_POS_P2,
             goal=GOAL_P2,
-            depth=depth,
-            evaluation_function=lambda x: both_goals_evaluation_function(x, (i - 5) / 5),
         )
-        quoridor = Quoridor(q_learner, random)
-        result = quoridor.play_game(simulate=True)
-
-        id = result.winner.id
-
-        if (id == 1):
-            q_counter += 1
-            # print("victory")
-        
-
-        print(f"game {i} ended")
-        print(f"player with id: {id} won")
-    print(f"q_learner wins: {q_counter}")
-
+        result = engine(q_learner, random_player).play_game(simulate=True)
+        total_moves += result.total_moves
+    elapsed = time.perf_counter() - start
+    print(f"{number_of_games / elapsed:.1f} games per second, {total_moves / elapsed:.0f} moves per second, "
+          f"{len(q_learner.q_values)} q values")
+
+
+def replay_training(number_of_games: int = 20, capacity: int = 10000, batch_size: int = 256,
+                    batches_per_game: int = 4, engine=BitboardQuoridor):
+    """
+    Trains a q learner against a random player from a replay buffer and prints the acting and learning times
+    """
+    q_learner = QLearningPlayer(
+        id=1,
+        pos=START_POS_P1,
+        goal=GOAL_P1,
+    )
+    q_learner.transitions = ReplayBuffer(capacity)
+    acting_time = learning_time = 0
+    for _ in range(number_of_games):
+        q_learner.pos = START_POS_P1
+        q_learner.walls = START_WALLS
+        q_learner.position_history = []
+        q_learner.placed_walls = []
+        random_player = RandomPlayer(
+            id=2,
+            pos=START_POS_P2,
+            goal=GOAL_P2,
+        )
+        start = time.perf_counter()
+        engine(q_learner, random_player).play_game(simulate=True)
+        acting_time += time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(batches_per_game):
+            q_learner.learn_batch(q_learner.transitions.sample(batch_size))
+        learning_time += time.perf_counter() - start
+    print(f"acting: {number_of_games / acting_time:.1f} games per second, "
+          f"learning: {number_of_games * batches_per_game * batch_size / learning_time:.0f} updates per second, "
+          f"{len(q_learner.transitions)} transitions, {len(q_learner.q_values)} q values")
+
+
+def mcts_vs_alphabeta(iterations: int = 500, depth: int = 1, number_of_matches: int = 10, workers=None):
+    """
+    Plays MCTS players with rollout leaves and with evaluation function leaves against alpha beta
+    """
+    factories = {
+        'mcts-rollout': lambda id, pos, goal: MCTSPlayer(id=id, pos=pos, goal=goal, iterations=iterations),
+        'mcts-evaluation': lambda id, pos, goal: MCTSPlayer(
+            id=id, pos=pos, goal=goal, iterations=iterations,
+            evaluation_function=lambda x: both_goals_evaluation_function(x, -1), evaluation_scale=2),
+        'alphabeta': alphabeta_factory(both_goals_evaluation_function, depth=depth),
+    }
+    schedule = [Match(player1, player2, seed=seed)
+                for seed in range(number_of_matches)
+                for player1, player2 in (('mcts-rollout', 'alphabeta'), ('alphabeta', 'mcts-evaluation'))]
+
+    tournament = Tournament(factories, engine=BitboardQuoridor, workers=workers)
+    standings = tournament.standings(list(tournament.run(schedule)))
+    for name, standing in standings.items():
+        print(f"{name}: won {standing.wins}/{standing.games}, {standing.mean_game_length:.1f} moves per game")
 
 
 if __name__ == '__main__':
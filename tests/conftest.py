@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2  # noqa: E402
+from Players import Player  # noqa: E402
+
+
+@pytest.fixture
+def make_game():
+    """
+    Builds a game of the given engine between two plain players and plays the moves of the PGN.
+    """
+    def make_game(engine, pgn=""):
+        game_state = engine(Player(1, START_POS_P1, GOAL_P1), Player(2, START_POS_P2, GOAL_P2))
+        for move in filter(None, pgn.split("/")):
+            game_state.make_move(move)
+        return game_state
+    return make_game
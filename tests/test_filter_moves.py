@@ -0,0 +1,43 @@
+"""
+filter_moves: the legal moves near the pawns and the placed walls.
+"""
+import random
+
+import pytest
+
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2, GameStatus
+from Players import Player, dist_from_cell, filter_moves
+from game_bitboard import BitboardQuoridor
+from game_faster import Quoridor
+
+ENGINES = [Quoridor, BitboardQuoridor]
+
+
+def _reference_filter(game_state):
+    near = [game_state.current_player.pos, game_state.waiting_player.pos] + \
+        [wall[:2] for wall in game_state.placed_walls]
+    return [move for move in game_state.get_legal_moves()
+            if len(move) == 2 or any(dist_from_cell(move, cell) <= 1 for cell in near)]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_filter_moves_matches_the_legal_moves(engine):
+    rng = random.Random(0)
+    for _ in range(3):
+        game_state = engine(Player(1, START_POS_P1, GOAL_P1), Player(2, START_POS_P2, GOAL_P2))
+        while game_state.status != GameStatus.COMPLETED and len(game_state.moves) < 60:
+            moves = filter_moves(game_state)
+            assert moves == _reference_filter(game_state)
+            # the legal walls are cached now
+            assert filter_moves(game_state) == moves
+            game_state.make_move(rng.choice(moves))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_filter_moves_reuses_the_checked_walls(engine):
+    game_state = engine(Player(1, START_POS_P1, GOAL_P1), Player(2, START_POS_P2, GOAL_P2))
+    for move in "e2/e8/e3/e7/d6h/f3h/c5v/f7".split("/"):
+        game_state.make_move(move)
+    moves = filter_moves(game_state)
+    game_state.validate_move = None
+    assert filter_moves(game_state) == moves
@@ -0,0 +1,62 @@
+"""
+The legal moves cache: cached results match a fresh generation after any sequence of moves and undos.
+"""
+import random
+
+import pytest
+
+from Constants import GameStatus
+from Heuristics import both_goals_evaluation_function
+from game_bitboard import BitboardQuoridor
+from game_faster import LEGAL_MOVES_CACHE_SIZE, Quoridor
+
+MID_GAME = "e2/e8/e3/e7/d6h/f3h/c5v/f7"
+ENGINES = [Quoridor, BitboardQuoridor]
+
+
+def _generated_moves(game_state):
+    return game_state._generate_legal_pawn_moves(), game_state._generate_legal_wall_moves()
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+def test_cached_moves_match_generation(make_game, engine):
+    rng = random.Random(0)
+    game_state = make_game(engine)
+    for _ in range(300):
+        assert (game_state.get_legal_pawn_moves(), game_state.get_legal_wall_moves()) == \
+            _generated_moves(game_state)
+        if game_state.moves and (game_state.status == GameStatus.COMPLETED or rng.random() < 0.3):
+            game_state.undo_move()
+        else:
+            game_state.make_move(rng.choice(sorted(game_state.get_legal_moves())))
+        assert len(game_state._legal_moves_cache) <= LEGAL_MOVES_CACHE_SIZE
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+def test_undo_restores_the_version(make_game, engine):
+    game_state = make_game(engine, MID_GAME)
+    version = game_state.version
+    walls = game_state.get_legal_wall_moves()
+    game_state.make_move("d4h")
+    assert game_state.version != version
+    game_state.undo_move()
+    assert game_state.version == version
+    # the parent's entry is still cached
+    game_state._generate_legal_wall_moves = None
+    assert game_state.get_legal_wall_moves() == walls
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+def test_cached_moves_are_copies(make_game, engine):
+    game_state = make_game(engine, MID_GAME)
+    game_state.get_legal_pawn_moves().clear()
+    game_state.get_legal_wall_moves().clear()
+    assert (game_state.get_legal_pawn_moves(), game_state.get_legal_wall_moves()) == \
+        _generated_moves(game_state)
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+def test_evaluation_does_not_generate_moves(make_game, engine):
+    game_state = make_game(engine, MID_GAME)
+    game_state._generate_legal_pawn_moves = game_state._generate_legal_wall_moves = None
+    both_goals_evaluation_function(game_state, -1)
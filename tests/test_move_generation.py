@@ -0,0 +1,66 @@
+"""
+Move generation checks: perft counts of fixed positions and the agreement of the engines.
+"""
+import pytest
+
+from exceptions import IllegalWallPlacementError
+from perft import differential, divide, perft
+from Players import Player
+from game_bitboard import BitboardQuoridor
+from game_faster import Quoridor
+
+MID_GAME = "e2/e8/e3/e7/d6h/f3h/c5v/f7"
+WALL_SATURATED = MID_GAME + "/h5h/d4h/h2h/d8v/a3v/c3v/f6h/f4v/e5v/d2v/g3v/e7h"
+ENGINES = [Quoridor, BitboardQuoridor]
+
+# (pgn, depth, leaves)
+PERFT_COUNTS = [
+    ("", 1, 131),
+    ("", 2, 16677),
+    ("e2/e8/e3/e7", 2, 16936),
+    (MID_GAME, 2, 13977),
+    (WALL_SATURATED, 2, 5768),
+]
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+@pytest.mark.parametrize("pgn, depth, leaves", PERFT_COUNTS)
+def test_perft(make_game, engine, pgn, depth, leaves):
+    game_state = make_game(engine, pgn)
+    assert perft(game_state, depth) == leaves
+    # the count restores the position
+    assert game_state.get_pgn() == pgn
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+def test_divide_sums_to_perft(make_game, engine):
+    counts = divide(make_game(engine, MID_GAME), 2)
+    assert sum(counts.values()) == 13977
+    assert list(counts) == sorted(counts)
+
+
+def test_engines_agree_on_random_games():
+    assert differential(Quoridor, BitboardQuoridor, games=20, seed=1) is None
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+def test_wall_enclosing_a_player_is_illegal(engine):
+    # a1h closes a1 and b1 from above, b1v would close them from the right
+    game_state = engine(Player(1, "a1", "9"), Player(2, "e9", "1"))
+    for move in ("a1h", "e8"):
+        game_state.make_move(move)
+    legal_walls = game_state.get_legal_wall_moves()
+    assert "b1v" not in legal_walls
+    assert "c1v" in legal_walls
+    with pytest.raises(IllegalWallPlacementError):
+        game_state.validate_move("b1v")
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.__name__)
+def test_legal_walls_keep_a_path_to_both_goals(make_game, engine):
+    game_state = make_game(engine, WALL_SATURATED)
+    for wall in game_state.get_legal_wall_moves():
+        game_state.make_move(wall)
+        for player in (game_state.current_player, game_state.waiting_player):
+            assert game_state.get_shortest_path(player.pos, player.goal)
+        game_state.undo_move()
@@ -0,0 +1,72 @@
+"""
+Q-table files: the on-disk format, the probing and the merge semantics.
+"""
+import pickle
+import random
+import struct
+
+import numpy as np
+import pytest
+
+from q_table_store import ACTIONS, HEADER, MAGIC, QTableStore, _slot, pack_key
+
+
+def _random_table(rng, size):
+    return {(rng.getrandbits(151), rng.choice(ACTIONS)): rng.uniform(-1, 1) for _ in range(size)}
+
+
+def test_write_and_lookup(tmp_path):
+    table = _random_table(random.Random(0), 5000)
+    store = QTableStore.write(str(tmp_path / "q.tbl"), table)
+    assert len(store) == len(table)
+    assert dict(store.items()) == table
+    assert all(store[state_action] == value for state_action, value in table.items())
+    assert (1, "e2") not in store
+    assert store.get((1, "e2")) is None
+    with pytest.raises(KeyError):
+        store[(1, "e2")]
+
+
+def test_merge_overrides_the_stored_values(tmp_path):
+    rng = random.Random(1)
+    path = str(tmp_path / "q.tbl")
+    first = _random_table(rng, 3000)
+    second = {state_action: value + 1 for state_action, value in list(first.items())[::2]}
+    second.update(_random_table(rng, 1000))
+    QTableStore.merge(path, first)
+    store = QTableStore.merge(path, second)
+    assert dict(store.items()) == {**first, **second}
+    # a store is a table too, and the later tables win
+    merged = dict(store.items())
+    assert dict(QTableStore.write(str(tmp_path / "copy.tbl"), store, first).items()) == {**merged, **first}
+
+
+def test_colliding_keys_wrap_around(tmp_path):
+    # 3 entries get a capacity of 8, all of them start at the last slot
+    rng = random.Random(2)
+    colliding = []
+    while len(colliding) < 4:
+        state_action = (rng.getrandbits(151), "e2")
+        if _slot(*pack_key(state_action), 8) == 7:
+            colliding.append(state_action)
+    table = {state_action: float(value) for value, state_action in enumerate(colliding[:3])}
+    store = QTableStore.write(str(tmp_path / "q.tbl"), table)
+    assert store.capacity == 8
+    assert sorted(np.nonzero(store.entries["hi"])[0]) == [0, 1, 7]
+    assert dict(store.items()) == table
+    assert colliding[3] not in store
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "q.tbl"
+    QTableStore.write(str(path), {(1, "e2"): 1.0})
+    data = bytearray(path.read_bytes())
+    data[:HEADER.size] = HEADER.pack(MAGIC, 1, *struct.unpack_from("<QQ", data, 8))
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="version"):
+        QTableStore(str(path))
+
+    pickled = tmp_path / "q.pkl"
+    pickled.write_bytes(pickle.dumps({(1, "e2"): 1.0}))
+    assert not QTableStore.is_store(str(pickled))
+    assert QTableStore.is_store(str(path))
@@ -0,0 +1,54 @@
+"""
+Q learning tables: the migration of old tables keyed by str(game_state).
+"""
+import random
+
+import pytest
+
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2, GameStatus
+from Players import Player
+from game_faster import STATE_KEY_WALLS_MASK, Quoridor
+from qlearning import QLearningPlayer, is_legacy_q_values, legacy_walls_key, migrate_q_values
+
+
+def _random_positions(seed, games=5, moves=40):
+    rng = random.Random(seed)
+    for _ in range(games):
+        game_state = Quoridor(Player(1, START_POS_P1, GOAL_P1), Player(2, START_POS_P2, GOAL_P2))
+        while game_state.status != GameStatus.COMPLETED and len(game_state.moves) < moves:
+            yield game_state
+            game_state.make_move(rng.choice(sorted(game_state.get_legal_moves())))
+
+
+def test_legacy_walls_key_matches_the_state_key():
+    for game_state in _random_positions(0):
+        assert legacy_walls_key(str(game_state)) == game_state.get_state_key() & STATE_KEY_WALLS_MASK
+
+
+def _legacy_table():
+    rng = random.Random(1)
+    table = {}
+    for game_state in _random_positions(1, games=2):
+        table[(str(game_state), rng.choice(game_state.get_legal_moves()))] = rng.uniform(-1, 1)
+    return table
+
+
+def test_migrated_values_are_kept():
+    legacy_table = _legacy_table()
+    assert is_legacy_q_values(legacy_table)
+    migrated = migrate_q_values(legacy_table)
+    q_learner = QLearningPlayer(1, START_POS_P1, GOAL_P1)
+    q_learner.set_q_values(legacy_table)
+    for game_state in _random_positions(1, games=2):
+        for (state, action), value in legacy_table.items():
+            if state == str(game_state):
+                assert migrated[(legacy_walls_key(state), action)] == value
+                assert q_learner.get_q_value(game_state, action) == value
+
+
+def test_export_with_legacy_values_raises(tmp_path):
+    q_learner = QLearningPlayer(1, START_POS_P1, GOAL_P1)
+    q_learner.set_q_values(_legacy_table())
+    with pytest.raises(ValueError):
+        q_learner.export_q_values(str(tmp_path / "q.tbl"))
+    assert not (tmp_path / "q.tbl").exists()
@@ -0,0 +1,66 @@
+"""
+Search checks: the transposition table in games with repeated positions.
+"""
+import math
+import multiprocessing
+import random
+
+import pytest
+
+from Heuristics import both_goals_evaluation_function
+from Players import AlphaBetaPlayer, Player
+from game_bitboard import BitboardQuoridor
+
+SEARCH_ALGORITHMS = ["minimax", "negamax"]
+
+
+def _game(pgn):
+    game_state = BitboardQuoridor(Player(1, "e1", "9"), Player(2, "e9", "1"))
+    for move in pgn.split("/"):
+        game_state.make_move(move)
+    return game_state
+
+
+def _player(search_algorithm):
+    return AlphaBetaPlayer(1, "e1", "9", lambda game_state: both_goals_evaluation_function(game_state, -1),
+                           depth=2, search_algorithm=search_algorithm)
+
+
+@pytest.mark.parametrize("search_algorithm", SEARCH_ALGORITHMS)
+def test_repetition_before_the_root_keeps_the_table(search_algorithm):
+    # both pawns went back and forth before the search
+    repeated, player = _game("e2/e8/e1/e9/e2/e8/e3/e7/d6h/f3h"), _player(search_algorithm)
+    # minimax breaks ties at random
+    random.seed(0)
+    action = player.get_action(repeated)
+    fresh = _player(search_algorithm)
+    random.seed(0)
+    assert fresh.get_action(_game("e2/e8/e3/e7/d6h/f3h")) == action
+    assert player.transposition_table.stores == fresh.transposition_table.stores > 0
+
+
+def test_entries_are_not_reused_across_repetitions():
+    # the same position with and without repetitions, searched by the same player
+    player = _player("negamax")
+    player.get_action(_game("e2/e8/e1/e9/e2/e8"))
+    assert player.get_action(_game("e2/e8")) == _player("negamax").get_action(_game("e2/e8"))
+
+
+def test_parallel_search_matches_serial_and_closes_the_pool():
+    game_state = _game("e2/e8/e3/e7/d6h/f3h/c5v/f7")
+    with AlphaBetaPlayer(1, "e1", "9", lambda state: both_goals_evaluation_function(state, -1), depth=2,
+                         search_algorithm="negamax", workers=2) as parallel:
+        assert parallel.get_action(game_state) == _player("negamax").get_action(game_state)
+        assert parallel._pool is not None
+    assert parallel._pool is None
+
+
+def test_worker_starts_a_new_search_for_every_root():
+    player = _player("negamax")
+    player._shared_alpha = multiprocessing.Value("d", -math.inf)
+    ages = []
+    for pgn in ("e2/e8", "e2/e8", "e2/e8/e3/e7"):
+        compact_state = _game(pgn).get_compact_state()
+        player._search_root_move(compact_state, "e3" if pgn == "e2/e8" else "e4", 1, None)
+        ages.append(player.transposition_table.age)
+    assert ages == [1, 1, 2]
@@ -0,0 +1,45 @@
+"""
+Tournament runner: reproducible results and learning players.
+"""
+from collections import defaultdict
+
+import pytest
+
+from Players import RandomPlayer
+from qlearning import QLearningPlayer
+from tournament import Match, Tournament
+
+SCHEDULE = [Match("random", "random", seed=seed) for seed in range(4)]
+
+
+def _random_factory(id, pos, goal):
+    return RandomPlayer(id, pos, goal)
+
+
+def test_results_do_not_depend_on_the_workers():
+    winners = []
+    for workers in (1, 2):
+        results = Tournament({"random": _random_factory}, workers=workers).run(SCHEDULE, progress=False)
+        winners.append(sorted((match.seed, result.winner.id) for match, result in results))
+    assert winners[0] == winners[1]
+
+
+def _learning_factories(q_values):
+    def q_learner_factory(id, pos, goal):
+        q_learner = QLearningPlayer(id, pos, goal)
+        q_learner.q_values = q_values
+        return q_learner
+    return {"q_learner": q_learner_factory, "random": _random_factory}
+
+
+def test_learning_players_learn_in_the_current_process():
+    q_values = defaultdict(float)
+    tournament = Tournament(_learning_factories(q_values), workers=2, learning_players=["q_learner"])
+    list(tournament.run([Match("q_learner", "random", seed=0)], progress=False))
+    assert q_values
+
+
+def test_undeclared_learning_players_are_rejected():
+    tournament = Tournament(_learning_factories(defaultdict(float)), workers=1)
+    with pytest.raises(ValueError):
+        list(tournament.run([Match("q_learner", "random", seed=0)], progress=False))
@@ -0,0 +1,246 @@
+"""
+Tournament runner, plays a schedule of games between players built by factories
+over a pool of worker processes.
+
+Every game gets its own seed, so a schedule gives the same results no matter
+how many workers play it or in which order the games finish.
+"""
+import multiprocessing
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import tqdm
+
+from Constants import START_POS_P1, GOAL_P1, START_POS_P2, GOAL_P2, GameStatus
+from Players import Player
+from game_faster import GameResult, Quoridor
+
+# (id, pos, goal) -> player
+PlayerFactory = Callable[[int, str, str], Player]
+
+
+@dataclass
+class Match:
+    """
+    Represents a scheduled game.
+
+    Attributes
+    ----------
+    player1 : str
+        The name of the factory of the first player.
+    player2 : str
+        The name of the factory of the second player.
+    seed : int
+        The seed of the random generators for the game.
+    """
+
+    player1: str
+    player2: str
+    seed: int
+
+
+@dataclass
+class Standing:
+    """
+    Represents the aggregated results of a player in the tournament.
+
+    Attributes
+    ----------
+    name : str
+        The name of the player's factory.
+    games : int
+        The number of games the player played.
+    wins : int
+        The number of games the player won.
+    game_lengths : list of int
+        The total number of moves of each of the player's games.
+    """
+
+    name: str
+    games: int = 0
+    wins: int = 0
+    game_lengths: List[int] = field(default_factory=lambda: [])
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+    @property
+    def mean_game_length(self) -> float:
+        return float(np.mean(self.game_lengths)) if self.game_lengths else 0.0
+
+
+def round_robin(names: Sequence[str], games_per_pair: int, seed: int = 0,
+                swap_seats: bool = True) -> List[Match]:
+    """
+    Schedules games between every pair of players.
+
+    Parameters
+    ----------
+    names : sequence of str
+        The names of the player factories.
+    games_per_pair : int
+        The number of games every pair plays.
+    seed : int, optional
+        The seed of the first game, the following games get the following seeds, by default 0.
+    swap_seats : bool, optional
+        Whether the players switch seats every game, by default True.
+
+    Returns
+    -------
+    list of Match
+        The schedule.
+    """
+    schedule = []
+    for i, first in enumerate(names):
+        for second in names[i + 1:]:
+            for game in range(games_per_pair):
+                player1, player2 = (second, first) if swap_seats and game % 2 else (first, second)
+                schedule.append(Match(player1, player2, seed + len(schedule)))
+    return schedule
+
+
+class Tournament:
+    """
+    Plays scheduled games in parallel.
+
+    The worker processes are forked, so the factories (and whatever they
+    use, e.g. evaluation functions or trained q values) don't have to be picklable.
+
+    A learning player (`expects_update`) would only update the copy of its q values in the worker
+    that plays its game, and the standings would depend on the number of workers. So the factories
+    that build learning players are declared in `learning_players`, and then the games are played one
+    after the other in the current process, where the updates carry over to the following games.
+    A game with a learning player whose factory isn't declared raises a ValueError.
+
+    Parameters
+    ----------
+    player_factories : dict of str and callable
+        Factories that build a player from its (id, pos, goal), by name.
+    engine : type, optional
+        The game engine, by default `Quoridor`.
+    workers : int, optional
+        The number of worker processes, by default the number of CPUs.
+        With 1 worker the games are played in the current process.
+    learning_players : sequence of str, optional
+        The names of the factories that build learning players, by default none.
+    """
+
+    def __init__(self, player_factories: Dict[str, PlayerFactory], engine: type = Quoridor,
+                 workers: Optional[int] = None, learning_players: Sequence[str] = ()):
+        self.player_factories = player_factories
+        self.engine = engine
+        self.workers = workers or multiprocessing.cpu_count()
+        self.learning_players = set(learning_players)
+
+    def play_match(self, match: Match) -> GameResult:
+        """
+        Plays a single scheduled game.
+
+        Parameters
+        ----------
+        match : Match
+            The game to play.
+
+        Returns
+        -------
+        GameResult
+            The result of the game, the winner and loser are plain `Player` copies
+            so the result can be sent between processes.
+        """
+        random.seed(match.seed)
+        np.random.seed(match.seed)
+        player1 = self.player_factories[match.player1](1, START_POS_P1, GOAL_P1)
+        player2 = self.player_factories[match.player2](2, START_POS_P2, GOAL_P2)
+        for name, player in ((match.player1, player1), (match.player2, player2)):
+            if player.expects_update and name not in self.learning_players:
+                raise ValueError(f"{name} builds a learning player, it has to be in learning_players")
+        try:
+            result = self.engine(player1, player2).play_game(simulate=True)
+        finally:
+            # e.g. the worker pools of parallel alpha beta players
+            for player in (player1, player2):
+                if hasattr(player, "close"):
+                    player.close()
+        if result.status == GameStatus.COMPLETED:
+            result.winner, result.loser = _copy_player(result.winner), _copy_player(result.loser)
+        return result
+
+    def run(self, schedule: Sequence[Match], progress: bool = True) -> Iterator[Tuple[Match, GameResult]]:
+        """
+        Plays the schedule, yielding the results as the games finish.
+
+        Parameters
+        ----------
+        schedule : sequence of Match
+            The games to play.
+        progress : bool, optional
+            Whether to show a progress bar, by default True.
+
+        Yields
+        ------
+        tuple of Match and GameResult
+            The scheduled game and its result, in order of completion.
+        """
+        with tqdm.tqdm(total=len(schedule), disable=not progress) as progress_bar:
+            if self.workers == 1 or self.learning_players:
+                for match in schedule:
+                    yield match, self.play_match(match)
+                    progress_bar.update()
+                return
+            context = multiprocessing.get_context("fork")
+            with context.Pool(self.workers, initializer=_init_tournament_worker, initargs=(self,)) as pool:
+                for index, result in pool.imap_unordered(_play_scheduled_match, enumerate(schedule)):
+                    yield schedule[index], result
+                    progress_bar.update()
+
+    def standings(self, results: Sequence[Tuple[Match, GameResult]]) -> Dict[str, Standing]:
+        """
+        Aggregates the win rates and game lengths of the players.
+
+        Parameters
+        ----------
+        results : sequence of tuple of Match and GameResult
+            The results of `run`.
+
+        Returns
+        -------
+        dict of str and Standing
+            The standing of every player, by name.
+        """
+        standings = {name: Standing(name) for name in self.player_factories}
+        for match, result in results:
+            for seat, name in enumerate((match.player1, match.player2), start=1):
+                standing = standings[name]
+                standing.games += 1
+                standing.game_lengths.append(result.total_moves)
+                if result.winner is not None and result.winner.id == seat:
+                    standing.wins += 1
+        return standings
+
+
+def _copy_player(player: Player) -> Player:
+    return Player(
+        id=player.id,
+        pos=player.pos,
+        goal=player.goal,
+        walls=player.walls,
+        position_history=list(player.position_history),
+        placed_walls=list(player.placed_walls),
+    )
+
+
+# The tournament played by the worker processes, set when the pool is forked
+_tournament = None
+
+
+def _init_tournament_worker(tournament):
+    global _tournament
+    _tournament = tournament
+
+
+def _play_scheduled_match(task):
+    index, match = task
+    return index, _tournament.play_match(match)
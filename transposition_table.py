@@ -0,0 +1,142 @@
+"""
+Transposition table for the search players.
+
+The table is a fixed-size array of entries indexed by the position's hash,
+so its memory stays bounded no matter how long the search runs.
+"""
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, Optional
+
+
+class Bound(Enum):
+    """
+    Represents how a stored score relates to the true value of the position.
+    """
+
+    EXACT: str = "Exact"
+    LOWER: str = "Lower"
+    UPPER: str = "Upper"
+
+
+@dataclass
+class TableEntry:
+    """
+    Represents a searched position in the transposition table.
+
+    Attributes
+    ----------
+    key : int
+        The full hash of the position, used to detect index collisions.
+    depth : int
+        The remaining depth the position was searched to.
+    score : float
+        The score of the position.
+    bound : Bound
+        Whether the score is exact, a lower bound or an upper bound.
+    move : str
+        The best move found in the position.
+    age : int
+        The search the entry was stored in.
+    """
+
+    key: int
+    depth: int
+    score: float
+    bound: Bound
+    move: str
+    age: int
+
+
+class TranspositionTable:
+    """
+    Bounded transposition table.
+
+    Parameters
+    ----------
+    size : int, optional
+        The number of entries in the table, by default `2 ** 16`.
+    replacement : str, optional
+        The replacement policy when two positions share an index:
+        * "depth": keep the deeper entry, unless it is left from a previous search.
+        * "always": always keep the newest entry.
+        By default "depth".
+    """
+
+    REPLACEMENT_POLICIES = ("depth", "always")
+
+    def __init__(self, size: int = 2 ** 16, replacement: str = "depth"):
+        if size <= 0:
+            raise ValueError("Transposition table size must be positive")
+        if replacement not in self.REPLACEMENT_POLICIES:
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+        self.size = size
+        self.replacement = replacement
+        self.entries: List[Optional[TableEntry]] = [None] * size
+        self.age = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self) -> None:
+        """
+        Marks the start of a new search, entries of older searches are replaced first.
+        """
+        self.age += 1
+
+    def probe(self, key: int) -> Optional[TableEntry]:
+        """
+        Looks up the given position.
+
+        Parameters
+        ----------
+        key : int
+            The hash of the position.
+
+        Returns
+        -------
+        TableEntry, optional
+            The entry of the position, `None` if it isn't stored.
+        """
+        entry = self.entries[key % self.size]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, score: float, bound: Bound, move: str) -> None:
+        """
+        Stores a searched position, according to the replacement policy.
+
+        Parameters
+        ----------
+        key : int
+            The hash of the position.
+        depth : int
+            The remaining depth the position was searched to.
+        score : float
+            The score of the position.
+        bound : Bound
+            Whether the score is exact, a lower bound or an upper bound.
+        move : str
+            The best move found in the position.
+        """
+        index = key % self.size
+        entry = self.entries[index]
+        if (
+            self.replacement == "depth"
+            and entry is not None
+            and entry.age == self.age
+            and entry.key != key
+            and entry.depth > depth
+        ):
+            return
+        self.entries[index] = TableEntry(key, depth, score, bound, move, self.age)
+        self.stores += 1
+
+    def clear(self) -> None:
+        """
+        Removes all the entries from the table.
+        """
+        self.entries = [None] * self.size
+        self.hits = 0
+        self.stores = 0